@@ -0,0 +1,131 @@
+"""
+Account deletion in two steps. delete_account() only deactivates the user - which logs them out everywhere - and
+queues the purge_account job; the job then deletes the account's comments, likes, timeline entries, follows and
+photos a bounded batch at a time, each batch in its own short transaction, instead of having Django's cascade
+collect everything in memory and delete it under one long lock. Progress is counted on the AccountDeletion row.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from album_photo.hot import heat
+from album_photo.jobs import enqueue
+from album_photo.likes import Like
+from album_photo.models import AccountDeletion, Comment, Follow, Photo, TimelineEntry
+from album_photo.signals import batch_reindex, photos_being_deleted
+
+logger = logging.getLogger(__name__)
+
+
+def delete_account(user):
+    """soft-deletes the user and queues the purge of their content; returns the AccountDeletion"""
+
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        deletion, _ = AccountDeletion.objects.get_or_create(user=user, defaults={"username": user.username})
+        enqueue("purge_account", deletion_id=deletion.pk)
+    return deletion
+
+
+def _delete_comments(comments, batch_size):
+    """
+    one batch; the delete signals take active comments off their photos' counters and queue the reindexing of the
+    photos, once each
+    """
+
+    with transaction.atomic(), batch_reindex():
+        ids = list(comments.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if ids:
+            Comment.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def _delete_likes(likes, batch_size, update_counts=True):
+    with transaction.atomic():
+        rows = list(likes.order_by("pk").values_list("pk", "photo_id")[:batch_size])
+        if rows:
+            Like.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+            if update_counts:
+                # a user likes a photo at most once, so each photo of the batch loses one like
+                Photo.objects.filter(pk__in={photo_id for _, photo_id in rows}).bump_version(
+                    like_count=F("like_count") - 1, **heat(-settings.PHOTO_HOT_WEIGHTS["like"]))
+    return len(rows)
+
+
+def _delete_rows(rows, batch_size):
+    """one batch of rows without delete signals or cascades of their own, e.g. timeline entries or follows"""
+
+    with transaction.atomic():
+        ids = list(rows.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if ids:
+            rows.model.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def _delete_photos(photos, batch_size):
+    """one batch of photos, with their comments and the likes they got deleted first, also in batches"""
+
+    photo_ids = list(photos.order_by("pk").values_list("pk", flat=True)[:batch_size])
+    if not photo_ids:
+        return 0
+    with photos_being_deleted(photo_ids):
+        while _delete_comments(Comment.objects.filter(photo_id__in=photo_ids), batch_size):
+            pass
+    while _delete_likes(Like.objects.filter(photo_id__in=photo_ids), batch_size, update_counts=False):
+        pass
+    with transaction.atomic():
+        # the delete signals remove the files, the search documents and the similarity hashes
+        Photo.objects.filter(pk__in=photo_ids).delete()
+    return len(photo_ids)
+
+
+def purge_account(deletion, batch_size=None, deadline=None):
+    """
+    deletes batches of the account's comments, then its likes, timeline entries and follows, then its photos,
+    counting each batch on the deletion row, until all are gone - then the user too - or `deadline` (a
+    time.monotonic() value) passes. Returns whether the purge is finished.
+    """
+
+    batch_size = batch_size or settings.ACCOUNT_PURGE_BATCH_SIZE
+    timeline_batch_size = settings.TIMELINE_BATCH_SIZE
+    user_id = deletion.user_id
+    # timeline entries (of the account's photos in the followers' timelines, then its own) and follows are not
+    # counted on the deletion row; a photo fanned out to many followers has as many entries
+    steps = [
+        ("comments_deleted", lambda: _delete_comments(Comment.objects.filter(author_id=user_id), batch_size)),
+        ("likes_deleted", lambda: _delete_likes(Like.objects.filter(user_id=user_id), batch_size)),
+        (None, lambda: _delete_rows(TimelineEntry.objects.filter(photo__owner_id=user_id), timeline_batch_size)),
+        (None, lambda: _delete_rows(TimelineEntry.objects.filter(user_id=user_id), timeline_batch_size)),
+        (None, lambda: _delete_rows(Follow.objects.filter(Q(follower_id=user_id) | Q(followed_id=user_id)),
+                                    timeline_batch_size)),
+        ("photos_deleted", lambda: _delete_photos(Photo.objects.filter(owner_id=user_id), batch_size)),
+    ]
+
+    if user_id is not None:
+        for counter, delete_batch in steps:
+            while True:
+                if deadline is not None and time.monotonic() > deadline:
+                    return False
+                deleted = delete_batch()
+                if not deleted:
+                    break
+                if counter is None:
+                    continue
+                AccountDeletion.objects.filter(pk=deletion.pk).update(**{counter: F(counter) + deleted})
+                deletion.refresh_from_db()
+                logger.info("Purging account %s: %s photos, %s comments, %s likes deleted so far", deletion.username,
+                            deletion.photos_deleted, deletion.comments_deleted, deletion.likes_deleted)
+
+        with transaction.atomic():
+            # nothing left for the cascade to collect
+            deletion.user.delete()
+
+    AccountDeletion.objects.filter(pk=deletion.pk).update(user=None, finished_at=timezone.now())
+    deletion.refresh_from_db()
+    logger.info("Purged account %s", deletion)
+    return True
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import Photo, Comment
+from .models import Photo, Comment, Job, AccountDeletion
 
 
 admin.site.register(Photo),
 admin.site.register(Comment),
+admin.site.register(Job),
+admin.site.register(AccountDeletion),
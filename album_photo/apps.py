@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AlbumPhotoConfig(AppConfig):
     name = 'album_photo'
+
+    def ready(self):
+        from album_photo import checks, signals, tasks  # noqa
@@ -0,0 +1,204 @@
+"""
+Native async versions of the feed, the photo detail and the like endpoints, used in place of the views of
+album_photo/views.py when settings.ASYNC_VIEWS is on (serve the project with photoalbum/asgi.py then).
+
+The ORM is synchronous, so every query still runs in a thread, but the independent queries of a page run in
+separate threads at the same time and the event loop is not blocked while they wait on the database.
+"""
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import InvalidPage, Paginator
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.views.generic.base import View
+
+from album_photo.forms import CommentCreationForm
+from album_photo.likes import Like, like_photo, liked_photo_ids, unlike_photo
+from album_photo.models import Photo
+from album_photo.pagination import CursorPaginator
+from album_photo.replicas import AsyncReplicaReadMixin
+from album_photo.timelines import follows_owner
+from album_photo.views import OnePhoto, ViewPhotos, comment_page
+
+
+def in_thread(func):
+    """
+    runs the database work of `func` in a thread of its own rather than the single thread shared by
+    thread-sensitive calls, so that several of them can be awaited concurrently; as a request would, the thread
+    gives up connections that are over CONN_MAX_AGE or broken. Each thread has its own connections, so with the
+    default CONN_MAX_AGE = 0 every call connects to the database and disconnects again - serve the async views with
+    persistent connections (CONN_MAX_AGE of a minute or so, the pool threads are reused) or behind a connection
+    pooler such as PgBouncer, or the setup eats the time the overlap saves. The check in album_photo/checks.py
+    warns about this.
+    """
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+class AsyncView(View):
+    """View whose handlers are coroutines; Django 3.1 only runs function views natively as async"""
+
+    login_required = False
+    raise_exception = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        # the user is loaded lazily from the session, which is a query - resolve it outside of the event loop
+        authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if self.login_required and not authenticated:
+            if self.raise_exception:
+                raise PermissionDenied
+            return redirect_to_login(request.get_full_path())
+
+        response = super().dispatch(request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+
+async def async_render(request, template_name, context):
+    # context processors and templates may still touch the session or lazy relations
+    return await sync_to_async(render)(request, template_name, context)
+
+
+def _liked_ids(user, photos):
+    """
+    like liked_photo_ids(), but `photos` may be an unevaluated queryset: the likes query then selects the
+    same page as a subquery (LIMIT inside IN is fine on PostgreSQL and SQLite) and does not have to wait
+    for the photos
+    """
+
+    if not user.is_authenticated:
+        return frozenset()
+    return frozenset(Like.objects.filter(user_id=user.pk, photo_id__in=photos.values("pk"))
+                     .values_list("photo_id", flat=True))
+
+
+class AsyncViewPhotos(AsyncReplicaReadMixin, AsyncView):
+    """async ViewPhotos: the page of photos, the total count and the like state are three concurrent queries"""
+
+    template_name = ViewPhotos.template_name
+    paginate_by = ViewPhotos.paginate_by
+
+    def get_queryset(self):
+        return Photo.objects.visible().select_related("owner").order_by("-creation_date")
+
+    async def get(self, request):
+        if settings.PHOTO_FEED_CURSOR_PAGINATION:
+            ctx = await self.cursor_context(request)
+        else:
+            ctx = await self.page_context(request)
+        return await async_render(request, self.template_name, ctx)
+
+    async def page_context(self, request):
+        page_number = request.GET.get("page") or 1
+        if page_number == "last":
+            # the offset of the last page depends on the count, so this one is fetched after it
+            paginator = Paginator(self.get_queryset(), self.paginate_by)
+            page_number = await in_thread(lambda: paginator.num_pages)()
+        try:
+            page_number = int(page_number)
+        except ValueError:
+            raise Http404("Page is not “last”, nor can it be converted to an int.")
+        if page_number < 1:
+            # checked before slicing, the querysets do not take negative offsets; a page past the end is only known
+            # from the count and is rejected by paginator.page() below
+            raise Http404("That page number is less than 1")
+
+        bottom = (page_number - 1) * self.paginate_by
+        page_queryset = self.get_queryset()[bottom:bottom + self.paginate_by]
+        count, photos, liked_ids = await asyncio.gather(
+            in_thread(self.get_queryset().count)(),
+            in_thread(list)(page_queryset),
+            in_thread(_liked_ids)(request.user, page_queryset),
+        )
+
+        paginator = Paginator(self.get_queryset(), self.paginate_by)
+        paginator.count = count
+        try:
+            page = paginator.page(page_number)
+        except InvalidPage as error:
+            raise Http404(str(error))
+        page.object_list = photos
+        return {"photos": photos, "page_obj": page, "paginator": paginator,
+                "is_paginated": paginator.num_pages > 1, "liked_photo_ids": liked_ids}
+
+    async def cursor_context(self, request):
+        paginator = CursorPaginator(self.get_queryset(), self.paginate_by)
+        try:
+            page = await in_thread(paginator.page)(after=request.GET.get("after"), before=request.GET.get("before"))
+        except InvalidPage as error:
+            raise Http404(str(error))
+        liked_ids = await in_thread(liked_photo_ids)(request.user, page.object_list)
+        return {"photos": page.object_list, "page_obj": page, "paginator": paginator,
+                "is_paginated": page.has_other_pages(), "liked_photo_ids": liked_ids}
+
+
+def _photo_with_owner(photo_id):
+    try:
+        return Photo.objects.visible().select_related("owner").get(pk=photo_id)
+    except Photo.DoesNotExist:
+        raise Http404("No such photo")
+
+
+class AsyncOnePhoto(AsyncReplicaReadMixin, AsyncView):
+    """
+    async OnePhoto for reading; the photo, its newest comments and whether the user likes it and follows its
+    owner are fetched concurrently. Comments are posted through the sync OnePhoto, see post().
+    """
+
+    login_required = True
+
+    async def get(self, request, photo_id):
+        photo, comments, liked_ids, following = await asyncio.gather(
+            in_thread(_photo_with_owner)(photo_id),
+            in_thread(comment_page)(photo_id),
+            in_thread(_liked_ids)(request.user, Photo.objects.filter(pk=photo_id)),
+            in_thread(follows_owner)(request.user, photo_id),
+        )
+        ctx = {"photo": photo, "form": CommentCreationForm(), "liked_photo_ids": liked_ids, "comments": comments,
+               "following": following}
+        return await async_render(request, "view_one_photo_tmp.html", ctx)
+
+    async def post(self, request, photo_id):
+        # a comment is a single short transaction followed by a redirect, there is nothing to overlap
+        return await sync_to_async(OnePhoto.as_view())(request, photo_id=photo_id)
+
+
+class AsyncLikePhotoApi(AsyncView):
+    login_required = True
+    raise_exception = True
+
+    async def post(self, request, pk):
+        return JsonResponse({"liked": True, "like_count": await in_thread(like_photo)(request.user, pk)})
+
+
+class AsyncUnlikePhotoApi(AsyncView):
+    login_required = True
+    raise_exception = True
+
+    async def post(self, request, pk):
+        return JsonResponse({"liked": False, "like_count": await in_thread(unlike_photo)(request.user, pk)})
@@ -0,0 +1,317 @@
+"""
+Seeding and route timing behind the `benchmark` and `benchmark_asgi` management commands. Everything here writes
+to whatever database is current - the commands run it against a throwaway test database.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from importlib import import_module, reload
+from io import BytesIO
+
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import clear_url_caches, get_resolver, reverse
+
+from album_photo.models import Comment, Follow, Photo
+from album_photo.search import rebuild_index
+from album_photo.similarity import dhash, to_db
+from album_photo.storage import photo_storage
+from album_photo.timelines import fan_out_photo
+
+BATCH_SIZE = 1000
+FOLLOWS_PER_USER = 10
+
+
+class QueryTimer:
+    """database execute wrapper counting queries and their time with perf_counter precision"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def tiny_jpeg(seed):
+    """a small, distinct JPEG - the benchmark measures the app, not image sizes"""
+
+    color = random.Random(seed).getrandbits(24).to_bytes(3, "big")
+    buffer = BytesIO()
+    Image.new("RGB", (64, 48), tuple(color)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def seed(users, photos, likes, comments, rng):
+    """bulk inserts the given volumes of rows; likes and comments are spread randomly over users and photos"""
+
+    password = make_password("benchmark")
+    User.objects.bulk_create((User(username=f"bench{i}", password=password) for i in range(users)),
+                             batch_size=BATCH_SIZE)
+    user_ids = list(User.objects.filter(username__startswith="bench").values_list("pk", flat=True))
+
+    # a handful of distinct blobs is enough, the content-addressed storage keeps each once
+    blobs = [photo_storage.save(f"bench{i}.jpg", ContentFile(tiny_jpeg(i))) for i in range(10)]
+    hashes = [to_db(dhash(BytesIO(tiny_jpeg(i)))) for i in range(len(blobs))]
+    Photo.objects.bulk_create((Photo(path=blobs[i % len(blobs)], description=f"Benchmark photo {i}",
+                                     owner_id=rng.choice(user_ids), dhash=hashes[i % len(blobs)])
+                               for i in range(photos)),
+                              batch_size=BATCH_SIZE)
+    photo_ids = list(Photo.objects.values_list("pk", flat=True))
+
+    like_pairs = set()
+    likes = min(likes, len(user_ids) * len(photo_ids))
+    while len(like_pairs) < likes:
+        like_pairs.add((rng.choice(photo_ids), rng.choice(user_ids)))
+    Photo.likes.through.objects.bulk_create((Photo.likes.through(photo_id=photo_id, user_id=user_id)
+                                             for photo_id, user_id in like_pairs), batch_size=BATCH_SIZE)
+
+    Comment.objects.bulk_create((Comment(content=f"Benchmark comment {i}", photo_id=rng.choice(photo_ids),
+                                         author_id=rng.choice(user_ids)) for i in range(comments)),
+                                batch_size=BATCH_SIZE)
+    Follow.objects.bulk_create((Follow(follower_id=follower_id, followed_id=followed_id)
+                                for follower_id in user_ids
+                                for followed_id in rng.sample(user_ids, min(FOLLOWS_PER_USER + 1, len(user_ids)))
+                                if followed_id != follower_id), batch_size=BATCH_SIZE)
+    for photo_id in photo_ids:
+        fan_out_photo(photo_id)
+
+    Photo.objects.recount()
+    rebuild_index()
+
+
+def scenarios(user, photo):
+    """
+    (name, route, method, path, data factory) of the requests to time, covering the routes of photoalbum/urls.py;
+    the photo and its owner `user` are the most commented photo and the logged-in benchmark user
+    """
+
+    feed_pages = max(Photo.objects.count() // 21, 1)
+    other_user = User.objects.exclude(pk=user.pk).order_by("pk").first() or user
+    media = photo.path.url
+    upload_counter = iter(range(10 ** 9))
+
+    def upload():
+        number = next(upload_counter)
+        return {"description": f"Uploaded {number}",
+                "path": SimpleUploadedFile(f"up{number}.jpg", tiny_jpeg(-number - 1), content_type="image/jpeg")}
+
+    return [
+        ("feed", "view_photos", "get", reverse("view_photos"), None),
+        ("feed deep page", "view_photos", "get", f"{reverse('view_photos')}?page={feed_pages}", None),
+        ("my photos", "my_photos", "get", reverse("my_photos"), None),
+        ("hot photos", "hot_photos", "get", reverse("hot_photos"), None),
+        ("home feed", "home_feed", "get", reverse("home_feed"), None),
+        ("follow", "follow", "post", reverse("follow", args=(other_user.pk,)), None),
+        ("unfollow", "unfollow", "post", reverse("unfollow", args=(other_user.pk,)), None),
+        ("search", "search", "get", f"{reverse('search')}?q=benchmark+photo", None),
+        ("export", "export_photos", "get", reverse("export_photos"), None),
+        ("photo detail", "one_photo", "get", reverse("one_photo", args=(photo.pk,)), None),
+        ("photo comments", "photo_comments", "get", reverse("photo_comments", args=(photo.pk,)), None),
+        ("similar photos", "similar_photos", "get", reverse("similar_photos", args=(photo.pk,)), None),
+        ("comment", "one_photo", "post", reverse("one_photo", args=(photo.pk,)), lambda: {"content": "Nice"}),
+        ("like", "like", "get", reverse("like", args=(photo.pk,)), None),
+        ("unlike", "unlike", "get", reverse("unlike", args=(photo.pk,)), None),
+        ("like api", "like_api", "post", reverse("like_api", args=(photo.pk,)), None),
+        ("unlike api", "unlike_api", "post", reverse("unlike_api", args=(photo.pk,)), None),
+        ("add photo form", "add_photo", "get", reverse("add_photo"), None),
+        ("upload", "add_photo", "post", reverse("add_photo"), upload),
+        ("edit photo form", "edit_photo", "get", reverse("edit_photo", args=(photo.pk,)), None),
+        ("edit photo", "edit_photo", "post", reverse("edit_photo", args=(photo.pk,)),
+         lambda: {"description": "Edited"}),
+        ("delete photo form", "delete_photo", "get", reverse("delete_photo", args=(photo.pk,)), None),
+        ("media", "media", "get", media, None),
+        ("login form", "login", "get", reverse("login"), None),
+        ("signup form", "signup", "get", reverse("signup"), None),
+        ("account settings", "account_settings", "get", reverse("account_settings"), None),
+        ("edit account form", "edit_personal_info", "get", reverse("edit_personal_info"), None),
+        ("delete account form", "delete_account", "get", reverse("delete_account"), None),
+        ("password change form", "password_change", "get", reverse("password_change"), None),
+        ("password change done", "password_change_done", "get", reverse("password_change_done"), None),
+        ("logout form", "logout", "get", reverse("logout"), None),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def run_benchmark(requests):
+    """times every scenario `requests` times and returns the per-route statistics"""
+
+    photo = Photo.objects.order_by("-comment_count", "pk").first()
+    client = Client()
+    client.force_login(photo.owner)
+    results = []
+
+    for name, route, method, path, data in scenarios(photo.owner, photo):
+        latencies, query_counts, query_times, statuses = [], [], [], set()
+        for _ in range(requests):
+            kwargs = {"data": data()} if data else {}
+            queries = QueryTimer()
+            with connection.execute_wrapper(queries):
+                start = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                latencies.append(time.perf_counter() - start)
+            query_counts.append(queries.count)
+            query_times.append(queries.seconds)
+            statuses.add(response.status_code)
+
+        results.append({
+            "name": name,
+            "route": route,
+            "method": method.upper(),
+            "status": sorted(statuses),
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "queries": round(sum(query_counts) / requests, 1),
+            "query_ms": round(sum(query_times) / requests * 1000, 2),
+        })
+    return results
+
+
+def uncovered_routes(results):
+    """names of routes in the URLconf that no scenario exercises, so new routes do not go unnoticed"""
+
+    covered = {result["route"] for result in results}
+    names = {pattern.name for pattern in get_resolver().url_patterns if getattr(pattern, "name", None)}
+    return sorted(names - covered)
+
+
+# routes served by album_photo/async_views.py, which `benchmark_asgi` loads concurrently
+THROUGHPUT_SCENARIOS = ["feed", "photo detail", "like api", "unlike api"]
+
+
+@contextmanager
+def async_views(enabled):
+    """switches settings.ASYNC_VIEWS, which the URLconf reads on import, and reloads the URLconf to match"""
+
+    urlconf = import_module(settings.ROOT_URLCONF)
+    try:
+        with override_settings(ASYNC_VIEWS=enabled):
+            reload(urlconf)
+            clear_url_caches()
+            yield
+    finally:
+        # once the setting is restored
+        reload(urlconf)
+        clear_url_caches()
+
+
+@contextmanager
+def counting_connections():
+    """counts the database connections opened within the block, in any thread, in the yielded list's only item"""
+
+    opened = [0]
+    lock = threading.Lock()
+
+    def count(sender, **kwargs):
+        with lock:
+            opened[0] += 1
+
+    connection_created.connect(count, weak=False)
+    try:
+        yield opened
+    finally:
+        connection_created.disconnect(count)
+
+
+def _throughput(latencies, statuses, elapsed, connections_opened):
+    return {
+        "status": sorted(set(statuses)),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        # with CONN_MAX_AGE = 0, several per request under the async views
+        "connections_per_request": round(connections_opened / len(latencies), 2),
+    }
+
+
+def wsgi_throughput(method, path, cookies, requests, concurrency):
+    """`requests` requests through the WSGI handler, `concurrency` threads at a time - as a threaded server would"""
+
+    local = threading.local()
+
+    def send(_):
+        if not hasattr(local, "client"):
+            local.client = Client(raise_request_exception=False)
+            local.client.cookies.update(cookies)
+        start = time.perf_counter()
+        response = getattr(local.client, method)(path)
+        return time.perf_counter() - start, response.status_code
+
+    with ThreadPoolExecutor(concurrency) as pool, counting_connections() as opened:
+        start = time.perf_counter()
+        latencies, statuses = zip(*pool.map(send, range(requests)))
+        elapsed = time.perf_counter() - start
+    return _throughput(latencies, statuses, elapsed, opened[0])
+
+
+def asgi_throughput(method, path, cookies, requests, concurrency):
+    """`requests` requests through the async handler, `concurrency` at a time on one event loop"""
+
+    async def load():
+        client = AsyncClient(raise_request_exception=False)
+        client.cookies.update(cookies)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def send():
+            async with slots:
+                start = time.perf_counter()
+                response = await getattr(client, method)(path)
+                return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(send() for _ in range(requests)))
+        return results, time.perf_counter() - start
+
+    with counting_connections() as opened:
+        results, elapsed = asyncio.run(load())
+    latencies, statuses = zip(*results)
+    return _throughput(latencies, statuses, elapsed, opened[0])
+
+
+def run_throughput(requests, concurrency):
+    """
+    loads every THROUGHPUT_SCENARIOS route under WSGI with the sync views, and under ASGI with the sync and with
+    the async views; returns requests per second and latency percentiles of each
+    """
+
+    photo = Photo.objects.order_by("-comment_count", "pk").first()
+    login = Client()
+    login.force_login(photo.owner)
+    modes = [("wsgi", False, wsgi_throughput), ("asgi", False, asgi_throughput),
+             ("asgi + async views", True, asgi_throughput)]
+    results = []
+
+    # failures show up in the status column; SQLite, for one, refuses concurrent writes to an in-memory database
+    request_logger = logging.getLogger("django.request")
+    request_logger.disabled = True
+    for mode, enabled, load in modes:
+        with async_views(enabled):
+            for name, route, method, path, data in scenarios(photo.owner, photo):
+                if name in THROUGHPUT_SCENARIOS:
+                    result = load(method, path, login.cookies, requests, concurrency)
+                    results.append({"name": name, "route": route, "mode": mode, **result})
+    request_logger.disabled = False
+    return results
@@ -0,0 +1,44 @@
+import threading
+from collections import Counter
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_lock = threading.Lock()
+_stats = Counter()
+_missing = object()
+
+
+def cache_stats():
+    """hits and misses of the counting caches in this process, keyed by cache location"""
+
+    with _lock:
+        return {key: {"hits": _stats[key, "hits"], "misses": _stats[key, "misses"]}
+                for key in sorted({location for location, _ in _stats})}
+
+
+def reset_cache_stats():
+    with _lock:
+        _stats.clear()
+
+
+class HitMissCounterMixin:
+    """counts hits and misses of get(), which is what the {% cache %} template tag uses"""
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.location = location
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        with _lock:
+            _stats[self.location, "misses" if value is _missing else "hits"] += 1
+        return default if value is _missing else value
+
+
+class CountingLocMemCache(HitMissCounterMixin, LocMemCache):
+    pass
+
+
+class CountingFileBasedCache(HitMissCounterMixin, FileBasedCache):
+    pass
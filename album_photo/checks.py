@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+from django.db import connections
+
+
+@register()
+def async_views_connections(app_configs, **kwargs):
+    """the async views run their queries in several threads, each with connections of its own"""
+
+    if not settings.ASYNC_VIEWS:
+        return []
+    return [
+        Warning(
+            f"ASYNC_VIEWS is on but database {alias!r} has CONN_MAX_AGE = 0, so each concurrent query of an async "
+            f"view opens and closes a connection.",
+            hint="Set CONN_MAX_AGE (e.g. 60) for the database, or connect through a pooler such as PgBouncer.",
+            id="album_photo.W001",
+        )
+        for alias in connections if not connections.databases[alias].get("CONN_MAX_AGE")
+    ]
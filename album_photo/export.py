@@ -0,0 +1,163 @@
+"""
+Streaming ZIP export of a user's album, see ExportPhotos. zipfile writes to an unseekable stream (sizes go into
+data descriptors after each file), so the archive is produced chunk by chunk as it is sent: apart from zipfile's small
+central directory record per file, memory use does not depend on the number or size of the photos.
+
+The rows are all read before the response starts, into spooled temporary files: under ASGI Django iterates a
+streaming response on the event loop, where the ORM cannot be used, so the generator only reads files.
+"""
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+
+from django.utils import timezone
+
+from album_photo.likes import Like
+from album_photo.models import Comment, Photo
+from album_photo.storage import photo_storage
+
+CHUNK_SIZE = 64 * 1024
+MANIFEST_BATCH_SIZE = 200
+# the file list and the manifest stay in memory up to this size, then go to disk
+SPOOL_SIZE = 1024 * 1024
+# image formats that are compressed already - deflating them again costs CPU and saves nothing
+STORED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+class _ChunkStream(io.RawIOBase):
+    """write-only, unseekable sink collecting what zipfile writes until the generator hands it on"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def archive_name(photo):
+    return f"photos/{photo.pk}{os.path.splitext(photo.path.name)[1].lower()}"
+
+
+def _spooled_lines(lines):
+    """the lines written to a spooled temporary file, rewound for reading"""
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, mode="w+")
+    for line in lines:
+        spool.write(line + "\n")
+    spool.seek(0)
+    return spool
+
+
+def _album_files(photos, missing):
+    """JSON of [storage name, name in the archive, creation date, size] of every photo whose file is stored"""
+
+    files = photos.only("pk", "path", "creation_date").order_by("pk")
+    for photo in files.iterator(chunk_size=MANIFEST_BATCH_SIZE):
+        try:
+            size = photo_storage.size(photo.path.name)
+        except OSError:
+            # a file lost from the storage should not abort the whole export
+            missing.add(photo.pk)
+            continue
+        yield json.dumps([photo.path.name, archive_name(photo), photo.creation_date.isoformat(), size])
+
+
+def _zip_info(name, date, size=0):
+    info = zipfile.ZipInfo(name, date_time=timezone.localtime(date).timetuple()[:6])
+    stored = os.path.splitext(name)[1] in STORED_EXTENSIONS
+    info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+    # the expected size lets zipfile switch to ZIP64 for files over 2 GiB
+    info.file_size = size
+    return info
+
+
+def _manifest_entries(photos, missing):
+    """
+    one line of JSON for every photo with its likers and active comments; related rows are fetched a batch of photos
+    at a time
+    """
+
+    last_pk = 0
+    while True:
+        batch = list(photos.filter(pk__gt=last_pk).order_by("pk")[:MANIFEST_BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        photo_ids = [photo.pk for photo in batch]
+
+        likers = {}
+        for photo_id, username in (Like.objects.filter(photo_id__in=photo_ids).order_by("user__username")
+                                   .values_list("photo_id", "user__username")):
+            likers.setdefault(photo_id, []).append(username)
+        comments = {}
+        for comment in (Comment.objects.filter(photo_id__in=photo_ids, active=True)
+                        .select_related("author").order_by("creation_date", "pk")):
+            comments.setdefault(comment.photo_id, []).append({
+                "author": comment.author.username,
+                "content": comment.content,
+                "creation_date": comment.creation_date.isoformat(),
+            })
+
+        for photo in batch:
+            yield json.dumps({
+                "file": None if photo.pk in missing else archive_name(photo),
+                "description": photo.description,
+                "creation_date": photo.creation_date.isoformat(),
+                "like_count": photo.like_count,
+                "liked_by": likers.get(photo.pk, []),
+                "comment_count": photo.comment_count,
+                "comments": comments.get(photo.pk, []),
+            })
+
+
+def zip_album(user):
+    """
+    reads the user's rows and returns a generator of the bytes of a ZIP of their original photos and a
+    manifest.json describing them; the generator itself makes no queries
+    """
+
+    photos = Photo.objects.filter(owner=user)
+    missing = set()
+    files = _spooled_lines(_album_files(photos, missing))
+    manifest = _spooled_lines(_manifest_entries(photos, missing))
+    return _zip_chunks(user.username, files, manifest)
+
+
+def _zip_chunks(owner, files, manifest):
+    stream = _ChunkStream()
+
+    with files, manifest, zipfile.ZipFile(stream, "w") as archive:
+        for line in files:
+            name, entry_name, creation_date, size = json.loads(line)
+            try:
+                source = photo_storage.open(name, "rb")
+            except OSError:
+                # deleted since the manifest was written, which still lists it
+                continue
+            info = _zip_info(entry_name, datetime.fromisoformat(creation_date), size)
+            with source, archive.open(info, "w") as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    target.write(chunk)
+                    yield stream.pop()
+            yield stream.pop()
+
+        with archive.open(_zip_info("manifest.json", timezone.now()), "w") as target:
+            target.write(f'{{\n"owner": {json.dumps(owner)},\n"photos": [\n'.encode())
+            for number, line in enumerate(manifest):
+                entry = json.dumps(json.loads(line), indent=2)
+                target.write(((",\n" if number else "") + entry).encode())
+                yield stream.pop()
+            target.write(b"\n]\n}\n")
+    yield stream.pop()
@@ -0,0 +1,90 @@
+"""
+"Popular photos" ranking. A photo's heat is the sum of the weights of its events (upload, likes, comments), each
+decaying by half every PHOTO_HOT_HALF_LIFE seconds. Decaying every row all the time is not needed for ranking: an
+event at time t adds weight * 2 ** ((t - epoch) / half_life) to Photo.hot_score, i.e. its weight measured from a
+fixed epoch, and all scores shrink by the same factor as time passes, so their order is that of the heat. The
+scores are thus updated in place by each like, unlike and comment, and a page of the hot feed is a range scan of
+the (hot_score, id) index.
+
+The scores grow with time; `update_hot_scores` moves the epoch (HotEpoch) to the present now and then, scaling
+every score down to match, long before they could overflow. Each row records the epoch its score is measured from
+(Photo.hot_epoch), and events add their points at that row's scale in the same UPDATE, so the pass can rescale and
+commit a batch of rows at a time without locking out likes and comments; while it runs, the rows not rescaled yet
+rank a little higher than they should.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Coalesce, Exp, Greatest
+
+from album_photo.models import HotEpoch, Photo
+
+
+def current_epoch(for_update=False):
+    epochs = HotEpoch.objects.select_for_update() if for_update else HotEpoch.objects.all()
+    return epochs.first() or HotEpoch.objects.create(timestamp=time.time())
+
+
+def _growth_rate():
+    # natural-log rate, so that exp(rate * seconds) doubles every half-life
+    return math.log(2) / settings.PHOTO_HOT_HALF_LIFE
+
+
+def heat(weight, now=None):
+    """
+    the field updates (hot_score and hot_epoch) for an event of `weight` (negative to take one back) happening now,
+    to be passed to update() as keyword arguments
+    """
+
+    now = time.time() if now is None else now
+    # a row without events yet takes the current epoch; without an epoch row either (a flushed database), events
+    # count at their full weight
+    epoch = Coalesce(F("hot_epoch"), Subquery(HotEpoch.objects.values("timestamp")[:1]), Value(now))
+    points = Value(float(weight)) * Exp((Value(now) - epoch) * Value(_growth_rate()))
+    # taking back a like at today's weight may remove more than it once added
+    return {"hot_score": Greatest(F("hot_score") + points, Value(0.0)), "hot_epoch": epoch}
+
+
+def rescore(photos):
+    """
+    sets the photos' scores from their like and comment counters, their events dated at the upload as the time of
+    each like is not kept; for photos uploaded before the hot feed existed
+    """
+
+    weights = settings.PHOTO_HOT_WEIGHTS
+    epoch = current_epoch().timestamp
+    scored = 0
+    rows = photos.order_by("pk").values_list("pk", "creation_date", "like_count", "comment_count")
+    for pk, created, like_count, comment_count in rows.iterator():
+        points = weights["upload"] + weights["like"] * like_count + weights["comment"] * comment_count
+        score = points * math.exp((created.timestamp() - epoch) * _growth_rate())
+        scored += Photo.objects.filter(pk=pk).update(hot_score=score, hot_epoch=epoch)
+    return scored
+
+
+def move_epoch(now=None, batch_size=1000):
+    """
+    the periodic decay pass: moves the epoch to `now`, then scales the scores down by the decay since the epoch
+    of each row, a range of ids per transaction. Returns the factor applied to the rows of the previous epoch.
+    """
+
+    now = time.time() if now is None else now
+    with transaction.atomic():
+        epoch = current_epoch(for_update=True)
+        previous = epoch.timestamp
+        HotEpoch.objects.filter(pk=epoch.pk).update(timestamp=now)
+
+    rate = Value(_growth_rate())
+    last_pk = 0
+    while True:
+        ids = list(Photo.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            break
+        # each row by its own epoch, read in the UPDATE itself: an event may have landed since the ids were read
+        Photo.objects.filter(pk__gt=last_pk, pk__lte=ids[-1], hot_epoch__lt=now).update(
+            hot_score=F("hot_score") * Exp((F("hot_epoch") - Value(now)) * rate), hot_epoch=Value(now))
+        last_pk = ids[-1]
+    return math.exp((previous - now) * _growth_rate())
@@ -0,0 +1,117 @@
+"""
+Bulk import of a directory tree of photos behind the `import_photos` management command. The tree is walked
+lazily, images are validated and copied into the photo storage by a pool of worker processes, and the rows are
+inserted in batches by the command - see Command.handle for the flow.
+"""
+import os
+from collections import deque
+
+from PIL import Image
+from django.core.files import File
+from django.db import transaction
+
+from album_photo.jobs import enqueue_many
+from album_photo.models import Photo
+from album_photo.similarity import dhash, to_db
+from album_photo.storage import ContentAddressedStorage
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+DESCRIPTION_LENGTH = Photo._meta.get_field("description").max_length
+
+
+def scan_images(root):
+    """yields paths of image files under `root`, relative to it, one directory listing in memory at a time"""
+
+    directories = [""]
+    while directories:
+        directory = directories.pop()
+        with os.scandir(os.path.join(root, directory)) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            relative_path = os.path.join(directory, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(relative_path)
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                yield relative_path
+        # popped from the end, so reversed to walk the tree in name order
+        directories.extend(reversed(subdirectories))
+
+
+def read_description(full_path):
+    """text of a photo.jpg.txt or photo.txt sidecar file, or else the file name turned into words"""
+
+    for sidecar in (full_path + ".txt", os.path.splitext(full_path)[0] + ".txt"):
+        try:
+            with open(sidecar, encoding="utf-8", errors="replace") as description:
+                text = description.read(DESCRIPTION_LENGTH * 4).strip()
+        except OSError:
+            continue
+        if text:
+            return text[:DESCRIPTION_LENGTH]
+
+    name = os.path.splitext(os.path.basename(full_path))[0]
+    return " ".join(name.replace("_", " ").replace("-", " ").split())[:DESCRIPTION_LENGTH] or name
+
+
+def store_image(location, root, relative_path):
+    """
+    runs in a worker process: checks that the file is an image Pillow can read (as the upload form does), hashes
+    its pixels and copies it into the content-addressed storage at `location`. Returns (relative path, stored name,
+    description, dHash) or (relative path, None, error message, None).
+    """
+
+    full_path = os.path.join(root, relative_path)
+    try:
+        with Image.open(full_path) as image:
+            width, height = image.size
+            image.verify()
+        if not width or not height:
+            raise ValueError("image has no pixels")
+        image_hash = to_db(dhash(full_path))
+        with open(full_path, "rb") as content:
+            name = ContentAddressedStorage(location=location).save(os.path.basename(full_path), File(content))
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as error:
+        return relative_path, None, str(error) or type(error).__name__, None
+    return relative_path, name, read_description(full_path), image_hash
+
+
+def bounded_map(pool, func, argument_tuples, window):
+    """pool.map() that keeps at most `window` calls in flight, so a huge or endless input is not read up front"""
+
+    pending = deque()
+    for arguments in argument_tuples:
+        pending.append(pool.submit(func, *arguments))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def insert_photos(owner, stored):
+    """
+    inserts a batch of (stored name, description, dHash) as the owner's photos and queues their processing,
+    indexing and fan-out to the followers' timelines; content the owner already has - from an earlier, interrupted
+    run or twice in the tree - is skipped. Returns the number of photos inserted.
+    """
+
+    with transaction.atomic():
+        names = {name for name, _, _ in stored}
+        existing = set(Photo.objects.filter(owner=owner, path__in=names).values_list("path", flat=True))
+        new = {}
+        for name, description, image_hash in stored:
+            if name not in existing:
+                new.setdefault(name, (description, image_hash))
+
+        Photo.objects.bulk_create(Photo(path=name, description=description, owner=owner, dhash=image_hash,
+                                        processing_status=Photo.PROCESSING_PENDING)
+                                  for name, (description, image_hash) in new.items())
+        # bulk_create does not return primary keys on every database
+        photo_ids = Photo.objects.filter(owner=owner, path__in=new).order_by("pk").values_list("pk", flat=True)
+        arguments = [{"photo_id": photo_id} for photo_id in photo_ids]
+        enqueue_many("process_photo", arguments)
+        enqueue_many("reindex_photo", arguments)
+        enqueue_many("fan_out_photo", arguments)
+    return len(new)
@@ -0,0 +1,145 @@
+"""
+A small database-backed job queue. Tasks are plain functions registered with the @task decorator; enqueue()
+stores a Job row which the `run_jobs` management command picks up and runs in a process pool. Failed jobs are
+retried with exponential backoff, up to Job.max_attempts. With JOBS_RUN_INLINE the job runs right away in the
+calling process instead - handy in tests and in development without a worker.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from album_photo.models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name=None, on_failure=None):
+    """registers the decorated function as a task; on_failure(**arguments) is called once retries run out"""
+
+    def register(func):
+        TASKS[name or func.__name__] = (func, on_failure)
+        return func
+
+    return register
+
+
+def enqueue(task_name, max_attempts=3, **arguments):
+    if task_name not in TASKS:
+        raise KeyError(f"Unknown task {task_name}")
+
+    job = Job.objects.create(task=task_name, arguments=arguments, max_attempts=max_attempts)
+    if settings.JOBS_RUN_INLINE:
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, attempts=F("attempts") + 1,
+                                             locked_at=timezone.now())
+        execute_job(job.pk)
+    return job
+
+
+def enqueue_many(task_name, arguments_list, max_attempts=3):
+    """enqueue() for many jobs of one task, stored with a single bulk insert"""
+
+    if settings.JOBS_RUN_INLINE:
+        return [enqueue(task_name, max_attempts, **arguments) for arguments in arguments_list]
+    if task_name not in TASKS:
+        raise KeyError(f"Unknown task {task_name}")
+    return Job.objects.bulk_create(Job(task=task_name, arguments=arguments, max_attempts=max_attempts)
+                                   for arguments in arguments_list)
+
+
+def _give_up(job):
+    """marks the job failed for good and runs the on_failure hook of its task, if any"""
+
+    logger.error("Job %s (%s) failed for good:\n%s", job.pk, job.task, job.last_error)
+    job.status = Job.FAILED
+    on_failure = TASKS.get(job.task, (None, None))[1]
+    if on_failure is not None:
+        try:
+            with transaction.atomic():
+                on_failure(**job.arguments)
+        except Exception:
+            logger.exception("on_failure of job %s (%s) failed", job.pk, job.task)
+
+
+def claim_jobs(limit):
+    """
+    marks up to `limit` due jobs as running and returns their ids. Jobs locked by a dead worker are reclaimed,
+    unless they have used up their attempts - a job that takes its worker down with it is then marked failed.
+    """
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    with transaction.atomic():
+        abandoned = (Job.objects.select_for_update(skip_locked=True)
+                     .filter(status=Job.RUNNING, locked_at__lt=stale, attempts__gte=F("max_attempts")))
+        for job in abandoned[:limit]:
+            job.last_error = "The worker running the job stopped"
+            _give_up(job)
+            job.locked_at = None
+            job.save(update_fields=["status", "locked_at", "last_error"])
+
+        due = (Job.objects.select_for_update(skip_locked=True)
+               .filter(Q(status=Job.PENDING, run_after__lte=now)
+                       | Q(status=Job.RUNNING, locked_at__lt=stale, attempts__lt=F("max_attempts")))
+               .order_by("run_after"))
+        ids = list(due.values_list("pk", flat=True)[:limit])
+        Job.objects.filter(pk__in=ids).update(status=Job.RUNNING, attempts=F("attempts") + 1, locked_at=now)
+    return ids
+
+
+def prune_jobs(batch_size=1000):
+    """deletes jobs done more than JOBS_KEEP_DONE seconds ago, a batch at a time; returns how many"""
+
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_KEEP_DONE)
+    deleted = 0
+    while True:
+        ids = list(Job.objects.filter(status=Job.DONE, run_after__lt=cutoff).values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Job.objects.filter(pk__in=ids).delete()[0]
+
+
+def execute_job(job_id):
+    """runs a claimed job and records its outcome"""
+
+    job = Job.objects.get(pk=job_id)
+
+    try:
+        if job.task not in TASKS:
+            # renamed or removed since the job was queued, retrying will not help
+            job.attempts = job.max_attempts
+            raise KeyError(f"Unknown task {job.task}")
+        func = TASKS[job.task][0]
+        func(**job.arguments)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            _give_up(job)
+        else:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1))
+        job.locked_at = None
+        job.save(update_fields=["status", "run_after", "locked_at", "last_error"])
+        return job.status
+
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, locked_at=None)
+    return Job.DONE
+
+
+def execute_job_in_worker(job_id):
+    """
+    execute_job() for the processes of `run_jobs`; module-level so that it can be sent to them. A worker lives
+    through many jobs, so connections that broke or expired in between are dropped, as Django does per request.
+    """
+
+    close_old_connections()
+    try:
+        return execute_job(job_id)
+    finally:
+        close_old_connections()
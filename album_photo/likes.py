@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404
+
+from album_photo.hot import heat
+from album_photo.models import Photo
+
+Like = Photo.likes.through
+
+
+def liked_photo_ids(user, photos):
+    """
+    ids of those of the photos that the user likes, for cheap `photo.pk in liked_photo_ids` checks in templates;
+    one query over the (user, photo) likes index instead of loading every liker of every photo
+    """
+
+    photo_ids = [photo.pk for photo in photos]
+    if not user.is_authenticated or not photo_ids:
+        return frozenset()
+
+    return frozenset(Like.objects.filter(user_id=user.pk, photo_id__in=photo_ids).values_list("photo_id", flat=True))
+
+
+def like_photo(user, photo_id):
+    """
+    adds the user's like with a single INSERT into the likes table, without loading the photo; a repeated or
+    concurrent like hits the unique (photo, user) constraint and changes nothing. Returns the new like count.
+    """
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Like.objects.create(photo_id=photo_id, user_id=user.pk)
+        except IntegrityError:
+            pass
+        else:
+            _change_like_count(photo_id, 1)
+        return _like_count(photo_id)
+
+
+def unlike_photo(user, photo_id):
+    """removes the user's like with a single DELETE, idempotently; returns the new like count"""
+
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(photo_id=photo_id, user_id=user.pk).delete()
+        if deleted:
+            _change_like_count(photo_id, -1)
+        return _like_count(photo_id)
+
+
+def _change_like_count(photo_id, delta):
+    changes = {"like_count": F("like_count") + delta, **heat(delta * settings.PHOTO_HOT_WEIGHTS["like"])}
+    if not Photo.objects.filter(pk=photo_id).bump_version(**changes):
+        # raised inside the transaction, so that a like of a missing photo is rolled back
+        raise Http404("No such photo")
+
+
+def _like_count(photo_id):
+    like_count = Photo.objects.filter(pk=photo_id).values_list("like_count", flat=True).first()
+    if like_count is None:
+        raise Http404("No such photo")
+    return like_count
@@ -0,0 +1,70 @@
+import json
+import platform
+import random
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from album_photo.benchmark import run_benchmark, seed, uncovered_routes
+
+
+class Command(BaseCommand):
+    help = ("Seeds a throwaway test database and reports p50/p95 latency, query count and query time of every "
+            "route, optionally as JSON to compare commits")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--photos", type=int, default=2000)
+        parser.add_argument("--likes", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=20000)
+        parser.add_argument("--requests", type=int, default=20, help="requests per route")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="file to write the JSON report to")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                seed(options["users"], options["photos"], options["likes"], options["comments"],
+                     random.Random(options["seed"]))
+                results = run_benchmark(options["requests"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "commit": self.git_commit(),
+            "date": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "debug": settings.DEBUG,
+            "volumes": {key: options[key] for key in ("users", "photos", "likes", "comments", "requests", "seed")},
+            "routes": results,
+            "uncovered_routes": uncovered_routes(results),
+        }
+
+        self.stdout.write(f"{'route':<24}{'status':>12}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'SQL ms':>9}")
+        for result in results:
+            status = ",".join(str(code) for code in result["status"])
+            self.stdout.write(f"{result['name']:<24}{status:>12}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                              f"{result['queries']:>9}{result['query_ms']:>9}")
+        if report["uncovered_routes"]:
+            self.stdout.write(f"Not benchmarked: {', '.join(report['uncovered_routes'])}")
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def git_commit(self):
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,65 @@
+import json
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from album_photo.benchmark import run_throughput, seed
+
+
+class Command(BaseCommand):
+    help = ("Seeds a throwaway test database and compares the throughput of the feed, photo detail and like API "
+            "under concurrent load: WSGI with sync views, ASGI with sync views and ASGI with async views")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--photos", type=int, default=2000)
+        parser.add_argument("--likes", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=20000)
+        parser.add_argument("--requests", type=int, default=200, help="requests per route and mode")
+        parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at a time")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--conn-max-age", type=int,
+                            help="CONN_MAX_AGE for the run instead of the configured one; 0 connects per query "
+                                 "thread of the async views")
+        parser.add_argument("--output", help="file to write the JSON report to")
+
+    def handle(self, *args, **options):
+        if options["conn_max_age"] is not None:
+            # connections read it from this very dict, also those opened later by other threads
+            for settings_dict in connections.databases.values():
+                settings_dict["CONN_MAX_AGE"] = options["conn_max_age"]
+        conn_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                seed(options["users"], options["photos"], options["likes"], options["comments"],
+                     random.Random(options["seed"]))
+                results = run_throughput(options["requests"], options["concurrency"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"CONN_MAX_AGE = {conn_max_age}")
+        self.stdout.write(f"{'route':<16}{'mode':<22}{'status':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+                          f"{'conn/req':>10}")
+        for result in results:
+            status = ",".join(str(code) for code in result["status"])
+            self.stdout.write(f"{result['name']:<16}{result['mode']:<22}{status:>10}{result['requests_per_s']:>10}"
+                              f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['connections_per_request']:>10}")
+
+        if options["output"]:
+            report = {
+                "database": connection.vendor,
+                "conn_max_age": conn_max_age,
+                "concurrency": options["concurrency"],
+                "volumes": {key: options[key] for key in ("users", "photos", "likes", "comments", "requests",
+                                                          "seed")},
+                "routes": results,
+            }
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
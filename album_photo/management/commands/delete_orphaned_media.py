@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from album_photo.orphans import RateLimiter, delete_orphan, orphaned_files
+
+
+class Command(BaseCommand):
+    help = ("Deletes media files that no photo references - originals and renditions of deleted photos, "
+            "leftovers of failed uploads - and reports the space reclaimed")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+        parser.add_argument("--grace", type=int, default=24 * 60 * 60,
+                            help="seconds within which a file was modified for it to be kept anyway, so that "
+                                 "uploads in progress are not touched")
+        parser.add_argument("--rate", type=float, default=50, help="files deleted per second at most, 0 for no limit")
+        parser.add_argument("--batch-size", type=int, default=1000, help="file names checked per query")
+
+    def handle(self, *args, **options):
+        root = settings.MEDIA_ROOT
+        limiter = RateLimiter(options["rate"])
+        found = deleted = reclaimed = 0
+
+        for name, size in orphaned_files(root, options["grace"], options["batch_size"]):
+            found += 1
+            if options["dry_run"]:
+                reclaimed += size
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{name} ({filesizeformat(size)})")
+                continue
+            limiter.wait()
+            if delete_orphan(root, name, options["grace"]):
+                deleted += 1
+                reclaimed += size
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"Deleted {name}")
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Found {found} orphaned files, {filesizeformat(reclaimed)} "
+                                                 f"reclaimable"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} of {found} orphaned files, reclaimed "
+                                                 f"{filesizeformat(reclaimed)}"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from album_photo.models import Photo
+from album_photo.renditions import generate_renditions, rendition_keys
+
+
+class Command(BaseCommand):
+    help = ("Generates missing renditions for already uploaded photos, including the WebP/AVIF encodings of "
+            "photos processed before those were enabled")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="regenerate renditions that already exist")
+        parser.add_argument("--chunk-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.order_by("pk")
+        if not options["force"]:
+            photos = photos.exclude(renditions__has_keys=rendition_keys())
+
+        done = failed = 0
+        for photo in photos.iterator(chunk_size=options["chunk_size"]):
+            try:
+                generate_renditions(photo, force=options["force"])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f"Photo {photo.pk}: {error}")
+            else:
+                done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Generated renditions for {done} photos, {failed} failed"))
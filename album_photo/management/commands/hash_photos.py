@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from album_photo.models import Photo
+from album_photo.similarity import dhash, to_db
+
+
+class Command(BaseCommand):
+    help = ("Computes the perceptual hashes of photos uploaded before near-duplicate detection existed; running "
+            "web processes pick them up when restarted")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.filter(dhash=None).only("path").order_by("pk")
+
+        done = failed = 0
+        for photo in photos.iterator(chunk_size=options["chunk_size"]):
+            try:
+                with photo.path.open("rb") as image:
+                    image_hash = to_db(dhash(image))
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f"Photo {photo.pk}: {error}")
+                continue
+            Photo.objects.filter(pk=photo.pk).update(dhash=image_hash)
+            done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Hashed {done} photos, {failed} failed"))
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from album_photo.imports import bounded_map, insert_photos, scan_images, store_image
+from album_photo.storage import photo_storage
+
+
+class Command(BaseCommand):
+    help = ("Imports a directory tree of photos for a user; descriptions come from photo.jpg.txt / photo.txt "
+            "sidecar files or from the file names. An interrupted import continues where it stopped when re-run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--owner", required=True, help="username of the owner of the imported photos")
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--batch-size", type=int, default=500, help="photos inserted per transaction")
+        parser.add_argument("--checkpoint",
+                            help="file listing the already imported files, by default .import_photos.checkpoint "
+                                 "in the directory")
+
+    def handle(self, *args, **options):
+        root = os.path.abspath(options["directory"])
+        if not os.path.isdir(root):
+            raise CommandError(f"{root} is not a directory")
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['owner']}")
+
+        checkpoint_path = options["checkpoint"] or os.path.join(root, ".import_photos.checkpoint")
+        done = set()
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, encoding="utf-8") as checkpoint:
+                done = {line.rstrip("\n") for line in checkpoint}
+
+        self.counts = {"imported": 0, "duplicates": 0, "failed": 0, "skipped": 0}
+        self.start = time.monotonic()
+        paths = ((photo_storage.location, root, path) for path in self.not_done(scan_images(root), done))
+
+        # workers only read files and write blobs; spawned, they do not share the parent's database connections
+        context = multiprocessing.get_context("spawn")
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options["processes"], mp_context=context,
+                                 initializer=django.setup) as pool, \
+                open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            batch = []
+            stored = bounded_map(pool, store_image, paths, options["processes"] * 8)
+            for relative_path, name, description, image_hash in stored:
+                if name is None:
+                    self.counts["failed"] += 1
+                    self.stderr.write(f"{relative_path}: {description}")
+                    continue
+                batch.append((relative_path, name, description, image_hash))
+                if len(batch) >= options["batch_size"]:
+                    self.flush(owner, batch, checkpoint)
+                    batch = []
+            if batch:
+                self.flush(owner, batch, checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(self.progress()))
+
+    def not_done(self, paths, done):
+        for path in paths:
+            if path in done:
+                self.counts["skipped"] += 1
+            else:
+                yield path
+
+    def flush(self, owner, batch, checkpoint):
+        inserted = insert_photos(owner, [stored_photo for _, *stored_photo in batch])
+        self.counts["imported"] += inserted
+        self.counts["duplicates"] += len(batch) - inserted
+
+        # written only once the rows are committed; a crash in between is covered by insert_photos skipping
+        # content the owner already has
+        checkpoint.writelines(f"{relative_path}\n" for relative_path, _, _, _ in batch)
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+        self.stdout.write(self.progress())
+
+    def progress(self):
+        elapsed = time.monotonic() - self.start
+        processed = self.counts["imported"] + self.counts["duplicates"] + self.counts["failed"]
+        return (f"Imported {self.counts['imported']}, duplicates {self.counts['duplicates']}, failed "
+                f"{self.counts['failed']}, already done {self.counts['skipped']} - "
+                f"{processed / elapsed if elapsed else 0:.1f} files/s")
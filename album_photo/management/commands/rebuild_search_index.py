@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from album_photo.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of photo descriptions and comments from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} photos"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from album_photo.models import Photo
+
+
+class Command(BaseCommand):
+    help = "Recomputes like_count and comment_count of photos in batches, fixing rows that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        checked = fixed = 0
+        last_pk = 0
+
+        while True:
+            # every batch is a separate short transaction touching only the rows that drifted
+            with transaction.atomic():
+                pks = list(Photo.objects.filter(pk__gt=last_pk).order_by("pk")
+                           .values_list("pk", flat=True)[:options["batch_size"]])
+                if not pks:
+                    break
+                drifted = list(Photo.objects.filter(pk__in=pks).with_actual_counts()
+                               .filter(~Q(like_count=F("actual_like_count"))
+                                       | ~Q(comment_count=F("actual_comment_count")))
+                               .values_list("pk", flat=True))
+                if drifted:
+                    fixed += Photo.objects.filter(pk__in=drifted).recount()
+
+            checked += len(pks)
+            last_pk = pks[-1]
+            self.stdout.write(f"Checked {checked} photos, fixed {fixed}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: checked {checked} photos, fixed {fixed}"))
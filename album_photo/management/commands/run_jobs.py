@@ -0,0 +1,62 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from album_photo.jobs import claim_jobs, execute_job_in_worker, prune_jobs
+
+logger = logging.getLogger(__name__)
+
+# seconds between two deletions of old finished jobs
+PRUNE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds to sleep when idle")
+        parser.add_argument("--once", action="store_true", help="exit as soon as no job is due")
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        running = {}
+        done = 0
+        pruned_at = 0
+
+        # spawned workers set Django up themselves instead of sharing the parent's database connections
+        context = multiprocessing.get_context("spawn")
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=django.setup) as pool:
+            while True:
+                if time.monotonic() - pruned_at >= PRUNE_INTERVAL:
+                    prune_jobs()
+                    pruned_at = time.monotonic()
+
+                if len(running) < processes:
+                    for job_id in claim_jobs(processes - len(running)):
+                        running[pool.submit(execute_job_in_worker, job_id)] = job_id
+
+                if not running:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                finished, _ = wait(running, timeout=options["poll_interval"], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job_id = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception:
+                        # the job stays running and is reclaimed after JOBS_LOCK_TIMEOUT, or failed for good
+                        logger.exception("Worker error while running job %s", job_id)
+                    done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {done} jobs"))
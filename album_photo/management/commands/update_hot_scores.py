@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from album_photo.hot import move_epoch, rescore
+from album_photo.models import Photo
+
+
+class Command(BaseCommand):
+    help = ("Moves the epoch of the hot scores to the present, scaling every score down by the decay since the last "
+            "run; run it daily or so from cron")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--rescore", action="store_true",
+                            help="first recompute every score from the like and comment counters, e.g. once for "
+                                 "photos uploaded before the hot feed existed")
+
+    def handle(self, *args, **options):
+        factor = move_epoch(batch_size=options["batch_size"])
+        self.stdout.write(f"Moved the epoch, scores scaled by {factor:.6g}")
+        if options["rescore"]:
+            scored = rescore(Photo.objects.all())
+            self.stdout.write(f"Rescored {scored} photos")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,84 @@
+"""
+Helpers of MediaView, which serves uploaded files in production: validators for conditional requests,
+single byte ranges, and handing the transfer over to the front web server.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+# the rendition encodings, which older Pythons' mimetypes do not know
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+def file_etag(stat):
+    # media files are never modified in place (blobs and renditions are named after their content),
+    # so size and modification time identify the bytes
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def cache_headers(response, stat, etag):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Cache-Control"] = f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def parse_range(header, size):
+    """
+    returns (start, end) of a single satisfiable byte range, with end inclusive; None when the header should be
+    ignored (missing, malformed or multiple ranges) and ValueError when the range can not be satisfied
+    """
+
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+
+    start, end = match.groups()
+    if start == "":
+        # suffix range - the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range outside of the file")
+    return start, end
+
+
+def read_range(path, start, end):
+    """yields the bytes from start to end inclusive, without reading more than CHUNK_SIZE at once"""
+
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def accel_headers(response, name, full_path):
+    """sets the header telling nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) to send the file"""
+
+    if settings.MEDIA_ACCEL == "x-accel-redirect":
+        # nginx decodes the URI of the redirect, so names with spaces, % or ? must be quoted
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+    elif settings.MEDIA_ACCEL == "x-sendfile":
+        response["X-Sendfile"] = os.path.abspath(full_path)
+    else:
+        raise ValueError(f"Unknown MEDIA_ACCEL {settings.MEDIA_ACCEL!r}")
+    return response
@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from album_photo.replicas import STICKY_COOKIE, replica_state
+
+logger = logging.getLogger(__name__)
+
+_current_timing = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    def __init__(self, kept_queries):
+        self.kept_queries = kept_queries
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.slowest = []
+        # async views run the queries of one request in several threads at once
+        self.lock = threading.Lock()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.query_count += 1
+                self.query_seconds += duration
+                # a bounded min-heap keeps only the slowest statements
+                if len(self.slowest) < self.kept_queries:
+                    heapq.heappush(self.slowest, (duration, sql))
+                elif self.slowest and duration > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, (duration, sql))
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timing = _current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing.record_query(execute, sql, params, many, context)
+
+
+def _install_wrapper(connection, **kwargs):
+    # connections are per thread, so the wrapper is installed on each as it is created and stays there; the
+    # context variable tells it which request (if any) the query belongs to, also in sync_to_async threads
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+def current_timing():
+    """the RequestTiming of the request being handled, or None outside of ServerTimingMiddleware"""
+
+    return _current_timing.get()
+
+
+class ServerTimingMiddleware:
+    """
+    measures SQL queries (through an execute wrapper on every connection), template rendering (through the
+    template backend of album_photo/template_backends.py) and the whole request, reports them in the Server-Timing
+    header and logs requests over the REQUEST_TIMING thresholds with their slowest queries. Works with DEBUG off;
+    when REQUEST_TIMING["ENABLED"] is false Django drops the middleware entirely. Runs natively in async mode too,
+    so it does not force async views back into a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.config = settings.REQUEST_TIMING
+        if not self.config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+        connection_created.connect(_install_wrapper)
+        for connection in connections.all():
+            _install_wrapper(connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timing = RequestTiming(self.config["LOGGED_QUERIES"])
+        token = _current_timing.set(timing)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timing.reset(token)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timing = RequestTiming(self.config["LOGGED_QUERIES"])
+        token = _current_timing.set(timing)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timing.reset(token)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    def report(self, request, response, timing, total):
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={timing.query_seconds * 1000:.1f};desc="{timing.query_count} queries"',
+            f"tpl;dur={timing.template_seconds * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+        if total * 1000 > self.config["SLOW_REQUEST_MS"] or timing.query_count > self.config["MAX_QUERIES"]:
+            slowest = "".join(f"\n  {duration * 1000:.1f} ms: {sql}"
+                              for duration, sql in sorted(timing.slowest, reverse=True))
+            logger.warning("Slow request %s %s: %.1f ms, %d queries in %.1f ms, templates %.1f ms%s",
+                           request.method, request.get_full_path(), total * 1000, timing.query_count,
+                           timing.query_seconds * 1000, timing.template_seconds * 1000, slowest)
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    tracks whether a request writes to the primary database and, if it does, keeps its client reading from the
+    primary for DATABASE_REPLICA_STICKY_SECONDS - see album_photo/replicas.py. Dropped without replicas configured.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with replica_state() as state:
+            response = self.get_response(request)
+        return self.stick(response, state)
+
+    async def __acall__(self, request):
+        with replica_state() as state:
+            response = await self.get_response(request)
+        return self.stick(response, state)
+
+    def stick(self, response, state):
+        if state.wrote:
+            response.set_cookie(STICKY_COOKIE, "1", max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite="Lax")
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing(apps, schema_editor):
+    Photo = apps.get_model('album_photo', 'Photo')
+    Comment = apps.get_model('album_photo', 'Comment')
+    likes = Photo.likes.through.objects.filter(photo=OuterRef('pk')).order_by().values('photo')
+    comments = Comment.objects.filter(photo=OuterRef('pk'), active=True).order_by().values('photo')
+    Photo.objects.update(
+        like_count=Coalesce(Subquery(likes.annotate(count=Count('pk')).values('count')), 0),
+        comment_count=Coalesce(Subquery(comments.annotate(count=Count('pk')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_photo', '0006_photo_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
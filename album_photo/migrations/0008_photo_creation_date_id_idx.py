@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_photo', '0007_photo_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['creation_date', 'id'], name='photo_creation_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:22
+
+import album_photo.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_photo', '0008_photo_creation_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='photo',
+            name='path',
+            field=models.ImageField(db_index=True, storage=album_photo.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
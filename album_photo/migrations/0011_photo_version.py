@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_photo', '0010_job_photo_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_photo', '0011_photo_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['photo', 'active', 'creation_date', 'id'], name='comment_photo_active_date_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_photo', '0012_comment_photo_active_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['owner', 'creation_date', 'id'], name='photo_owner_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """the side table of album_photo.search, filled with the documents of the existing photos"""
+
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("""
+            CREATE TABLE album_photo_photo_search (
+                photo_id integer PRIMARY KEY REFERENCES album_photo_photo (id) ON DELETE CASCADE,
+                document tsvector NOT NULL
+            )
+        """)
+        schema_editor.execute("CREATE INDEX album_photo_photo_search_gin ON album_photo_photo_search "
+                              "USING GIN (document)")
+        schema_editor.execute("""
+            INSERT INTO album_photo_photo_search (photo_id, document)
+            SELECT p.id, setweight(to_tsvector(%s::regconfig, p.description), 'A')
+                         || setweight(to_tsvector(%s::regconfig, coalesce(string_agg(c.content, ' '), '')), 'B')
+            FROM album_photo_photo p LEFT JOIN album_photo_comment c ON c.photo_id = p.id AND c.active
+            GROUP BY p.id
+        """, [settings.PHOTO_SEARCH_CONFIG] * 2)
+    elif vendor == "sqlite":
+        schema_editor.execute("CREATE VIRTUAL TABLE album_photo_photo_search USING fts5("
+                              "description, comments, tokenize = 'porter unicode61 remove_diacritics 2')")
+        schema_editor.execute("""
+            INSERT INTO album_photo_photo_search (rowid, description, comments)
+            SELECT p.id, p.description, coalesce(group_concat(c.content, ' '), '')
+            FROM album_photo_photo p LEFT JOIN album_photo_comment c ON c.photo_id = p.id AND c.active
+            GROUP BY p.id
+        """)
+    else:
+        # no full-text index, album_photo.search scans instead; the empty table keeps the rest uniform
+        schema_editor.execute("CREATE TABLE album_photo_photo_search (photo_id integer PRIMARY KEY)")
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute("DROP TABLE album_photo_photo_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_photo', '0013_photo_owner_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
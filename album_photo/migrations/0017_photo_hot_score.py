@@ -0,0 +1,40 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:58
+
+import time
+
+from django.db import migrations, models
+
+
+def create_epoch(apps, schema_editor):
+    apps.get_model("album_photo", "HotEpoch").objects.create(timestamp=time.time())
+
+
+def delete_epoch(apps, schema_editor):
+    apps.get_model("album_photo", "HotEpoch").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('album_photo', '0016_accountdeletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotEpoch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='hot_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['hot_score', 'id'], name='photo_hot_score_id_idx'),
+        ),
+        migrations.RunPython(create_epoch, delete_epoch),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def add_owner_entries(apps, schema_editor):
+    """puts every existing photo into its owner's timeline, a batch of photos per transaction"""
+
+    Photo = apps.get_model("album_photo", "Photo")
+    TimelineEntry = apps.get_model("album_photo", "TimelineEntry")
+    last_pk = 0
+    while True:
+        photos = list(Photo.objects.filter(pk__gt=last_pk).order_by("pk")
+                      .values_list("pk", "owner_id", "creation_date")[:BATCH_SIZE])
+        if not photos:
+            return
+        with transaction.atomic(using=schema_editor.connection.alias):
+            TimelineEntry.objects.bulk_create((TimelineEntry(user_id=owner_id, photo_id=pk, creation_date=date)
+                                               for pk, owner_id, date in photos), ignore_conflicts=True)
+        last_pk = photos[-1][0]
+
+
+class Migration(migrations.Migration):
+    # every batch commits on its own instead of the whole table in one transaction
+    atomic = False
+
+    dependencies = [
+        ('album_photo', '0018_follow_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_owner_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:23
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def set_row_epochs(apps, schema_editor):
+    """scores so far were all measured from the single HotEpoch, which becomes the epoch of every scored row"""
+
+    epoch = apps.get_model("album_photo", "HotEpoch").objects.first()
+    if epoch is None:
+        return
+    Photo = apps.get_model("album_photo", "Photo")
+    last_pk = 0
+    while True:
+        ids = list(Photo.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Photo.objects.filter(pk__gt=last_pk, pk__lte=ids[-1]).exclude(hot_score=0).update(
+                hot_epoch=epoch.timestamp)
+        last_pk = ids[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('album_photo', '0019_timeline_owner_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='hot_epoch',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_row_epochs, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,109 @@
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from album_photo.storage import photo_storage
+
+
+class PhotoQuerySet(models.QuerySet):
+    def visible(self):
+        """photos shown to others: those of deleted accounts are hidden while their purge is in progress"""
+
+        return self.filter(owner__is_active=True)
+
+    def with_actual_counts(self):
+        """annotates like and comment counts computed from the likes and Comment tables"""
+
+        return self.annotate(actual_like_count=_actual_like_count(), actual_comment_count=_actual_comment_count())
+
+    def recount(self):
+        """overwrites the counters with actual counts in a single UPDATE, returns the number of rows"""
+
+        return self.bump_version(like_count=_actual_like_count(), comment_count=_actual_comment_count())
+
+    def bump_version(self, **changes):
+        """updates the given fields and the version stamp, which invalidates cached photo cards"""
+
+        return self.update(version=F("version") + 1, **changes)
+
+
+def _count(queryset):
+    """turns a queryset correlated with OuterRef("pk") into a single-value COUNT expression"""
+
+    return Coalesce(Subquery(queryset.order_by().values("photo").annotate(count=Count("pk")).values("count")), 0)
+
+
+def _actual_like_count():
+    return _count(Photo.likes.through.objects.filter(photo=OuterRef("pk")))
+
+
+def _actual_comment_count():
+    return _count(Comment.objects.filter(photo=OuterRef("pk"), active=True))
 
 
 class Photo(models.Model):
-    path = models.ImageField()
+    PROCESSING_PENDING = "pending"
+    PROCESSING_READY = "ready"
+    PROCESSING_FAILED = "failed"
+    PROCESSING_STATUSES = [
+        (PROCESSING_PENDING, "Pending"),
+        (PROCESSING_READY, "Ready"),
+        (PROCESSING_FAILED, "Failed"),
+    ]
+
+    # indexed, since a blob shared by duplicate uploads is deleted only when no row references it any more
+    path = models.ImageField(storage=photo_storage, db_index=True)
     description = models.CharField(max_length=500)
     creation_date = models.DateTimeField(auto_now_add=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     likes = models.ManyToManyField(User, related_name="like_pictures")
+    renditions = models.JSONField(default=dict, blank=True)
+    # denormalized counters, kept in step by the views and signals; recount_photo_counters repairs drift
+    like_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+    # state of the upload-time background work (renditions etc.), see album_photo.tasks.process_photo
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_STATUSES, default=PROCESSING_READY)
+    # bumped whenever anything shown on the photo's card changes; part of the card's fragment cache key
+    version = models.PositiveIntegerField(default=1)
+    # 64-bit difference hash of the pixels (stored signed), for finding near-duplicates - see album_photo.similarity
+    dhash = models.BigIntegerField(null=True, blank=True)
+    # time-decayed like and comment activity, relative to hot_epoch and updated in place - see album_photo.hot
+    hot_score = models.FloatField(default=0.0)
+    # the HotEpoch timestamp hot_score is measured from; null until the first event
+    hot_epoch = models.FloatField(null=True, blank=True)
+
+    objects = PhotoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # serves keyset pagination of the feed, see album_photo.pagination
+            models.Index(fields=["creation_date", "id"], name="photo_creation_date_id_idx"),
+            # serves "My photos", newest first, paged by number or by cursor
+            models.Index(fields=["owner", "creation_date", "id"], name="photo_owner_date_id_idx"),
+            # serves the hot feed, highest score first, paged by cursor
+            models.Index(fields=["hot_score", "id"], name="photo_hot_score_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.description}"
 
+    def rendition(self, name, image_format=None):
+        """
+        returns url of the smallest stored rendition at least as wide as the requested one, or of the original;
+        with an image_format ("webp", "avif"), url of that encoding of it, or None if it has not been made
+        """
+
+        key = f"{{}}.{image_format}" if image_format else "{}"
+        width = settings.PHOTO_RENDITIONS[name]
+        for candidate, candidate_width in sorted(settings.PHOTO_RENDITIONS.items(), key=lambda item: item[1]):
+            if candidate_width >= width and self.renditions.get(key.format(candidate)):
+                return default_storage.url(self.renditions[key.format(candidate)])
+        return None if image_format else self.path.url
+
 
 class Comment(models.Model):
     content = models.CharField(max_length=500)
@@ -20,5 +112,123 @@ class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # serves the newest-first, cursor paginated comments of a photo
+            models.Index(fields=["photo", "active", "creation_date", "id"], name="comment_photo_active_date_idx"),
+        ]
+
     def __str__(self):
         return f"{self.content}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so that signals can tell when the active flag is toggled
+        instance._loaded_active = instance.__dict__.get("active")
+        return instance
+
+
+class Job(models.Model):
+    """a unit of background work, executed by the run_jobs command - see album_photo.jobs"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    task = models.CharField(max_length=100)
+    arguments = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    creation_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+
+
+class Follow(models.Model):
+    """`follower` sees the photos of `followed` in their home feed, see album_photo.timelines"""
+
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
+    followed = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers")
+    # set on every follow of an account with TIMELINE_FAN_OUT_LIMIT followers or more: its photos are not copied
+    # into the followers' timelines but read from the photo table along with them
+    fan_out_on_read = models.BooleanField(default=False)
+    creation_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["follower", "followed"], name="follow_follower_followed_uniq"),
+        ]
+        indexes = [
+            # serves fan-out to the followers of an account, a range of ids at a time
+            models.Index(fields=["followed", "id"], name="follow_followed_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.follower} follows {self.followed}"
+
+
+class TimelineEntry(models.Model):
+    """a photo in a user's home feed, written by fan-out when it is uploaded or when its owner is followed"""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="+")
+    # the photo's, copied so that a page of the timeline is a range of a single index
+    creation_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "photo"], name="timeline_user_photo_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "creation_date", "photo"], name="timeline_user_date_photo_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.photo} in the timeline of {self.user}"
+
+
+class HotEpoch(models.Model):
+    """the single row holding the moment (a Unix timestamp) that Photo.hot_score values are measured from"""
+
+    timestamp = models.FloatField()
+
+    def __str__(self):
+        return f"Hot score epoch {self.timestamp}"
+
+
+class AccountDeletion(models.Model):
+    """
+    a deleted account: deactivated at once, its comments, likes and photos then purged in batches by the
+    purge_account job - see album_photo.accounts. The row outlives the user as a record of the purge's progress.
+    """
+
+    user = models.OneToOneField(User, null=True, blank=True, on_delete=models.SET_NULL)
+    username = models.CharField(max_length=150)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    comments_deleted = models.PositiveIntegerField(default=0)
+    likes_deleted = models.PositiveIntegerField(default=0)
+    photos_deleted = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        state = f"finished {self.finished_at:%Y-%m-%d %H:%M}" if self.finished_at else "in progress"
+        return (f"{self.username} ({state}: {self.photos_deleted} photos, {self.comments_deleted} comments, "
+                f"{self.likes_deleted} likes deleted)")
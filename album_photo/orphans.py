@@ -0,0 +1,108 @@
+"""
+Garbage collection of media files no photo references any more, behind the `delete_orphaned_media` command.
+This is the only place originals are deleted: a blob can be shared by several rows, and an upload of the same
+content reuses it - touching its mtime - before its own row is committed, so a blob is only safe to delete once it
+is unreferenced and untouched for the grace period. release_photo_files removes the renditions of a deleted photo,
+but they are left behind when a process dies between the commit and the on_commit hook, when renditions are
+regenerated, or when an upload fails after its blob was stored. The media tree is streamed with os.scandir, and the
+names are checked against Photo.path and Photo.renditions a batch at a time, so neither the tree nor the table is
+ever held in memory.
+"""
+import os
+import time
+
+from album_photo.models import Photo
+
+RENDITION_DIRECTORY = "renditions"
+
+
+def walk_files(root):
+    """yields (name relative to `root` with / separators, os.stat_result) of every regular file under `root`"""
+
+    directories = [""]
+    while directories:
+        directory = directories.pop()
+        with os.scandir(os.path.join(root, directory)) as entries:
+            for entry in entries:
+                name = f"{directory}/{entry.name}" if directory else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry.stat(follow_symlinks=False)
+
+
+def _rendition_photo_id(name):
+    # renditions are stored as renditions/<photo id>/<name>-<digest>.<extension>, see rendition_name
+    parts = name.split("/")
+    if len(parts) == 3 and parts[0] == RENDITION_DIRECTORY and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+def _unreferenced(batch):
+    """those of the (name, size) pairs whose name is neither a photo's original nor one of its renditions"""
+
+    names = [name for name, _ in batch]
+    referenced = set(Photo.objects.filter(path__in=names).values_list("path", flat=True))
+    photo_ids = {_rendition_photo_id(name) for name in names} - {None}
+    for renditions in Photo.objects.filter(pk__in=photo_ids).values_list("renditions", flat=True):
+        referenced.update(renditions.values())
+    return [(name, size) for name, size in batch if name not in referenced]
+
+
+def orphaned_files(root, grace, batch_size=1000):
+    """
+    yields (name, size) of the files under `root` no photo references; files modified in the last `grace` seconds
+    are left alone, they may belong to an upload whose row is not committed yet
+    """
+
+    cutoff = time.time() - grace
+    batch = []
+    for name, stat in walk_files(root):
+        if stat.st_mtime > cutoff:
+            continue
+        batch.append((name, stat.st_size))
+        if len(batch) >= batch_size:
+            yield from _unreferenced(batch)
+            batch = []
+    if batch:
+        yield from _unreferenced(batch)
+
+
+class RateLimiter:
+    """spaces calls of wait() at least 1 / `rate` seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time = max(self.next_time, now) + self.interval
+
+
+def delete_orphan(root, name, grace):
+    """
+    deletes the file unless it was modified since it was found - a new upload of the same content reuses an
+    orphaned blob and refreshes its mtime - and then the directories it leaves empty. Returns whether it did.
+    """
+
+    full_path = os.path.join(root, name)
+    try:
+        if os.stat(full_path, follow_symlinks=False).st_mtime > time.time() - grace:
+            return False
+        os.remove(full_path)
+    except FileNotFoundError:
+        return False
+
+    directory = os.path.dirname(name)
+    while directory:
+        try:
+            os.rmdir(os.path.join(root, directory))
+        except OSError:
+            # not empty
+            break
+        directory = os.path.dirname(directory)
+    return True
@@ -0,0 +1,113 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    keyset paginator walking a queryset newest first by (key, tie_breaker). Pages are addressed with opaque
+    cursors encoding the edge row, so a page is one index range scan - no OFFSET and no COUNT(*).
+    """
+
+    def __init__(self, queryset, per_page, key="creation_date", tie_breaker="id"):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key = key
+        self.tie_breaker = tie_breaker
+
+    def encode_cursor(self, obj):
+        field = self.queryset.model._meta.get_field(self.key)
+        values = [field.value_to_string(obj), getattr(obj, self.tie_breaker)]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != 2:
+                raise ValueError("a cursor is a [key, tie breaker] pair")
+            value = self.queryset.model._meta.get_field(self.key).to_python(values[0])
+            # the key may be null, the tie breaker (a primary key) may not
+            tie_breaker = int(values[1])
+        except (TypeError, ValueError, ValidationError) as error:
+            raise InvalidPage("Invalid cursor") from error
+        return value, tie_breaker
+
+    def _after(self, value, tie_breaker):
+        # the redundant leading <= lets the database use the (key, tie_breaker) index as a range
+        return (Q(**{f"{self.key}__lte": value})
+                & (Q(**{f"{self.key}__lt": value}) | Q(**{f"{self.tie_breaker}__lt": tie_breaker})))
+
+    def _before(self, value, tie_breaker):
+        return (Q(**{f"{self.key}__gte": value})
+                & (Q(**{f"{self.key}__gt": value}) | Q(**{f"{self.tie_breaker}__gt": tie_breaker})))
+
+    def page(self, after=None, before=None):
+        """returns the page following the `after` cursor, preceding the `before` cursor, or the first one"""
+
+        descending = self.queryset.order_by(f"-{self.key}", f"-{self.tie_breaker}")
+        if before:
+            rows = list(self.queryset.filter(self._before(*self.decode_cursor(before)))
+                        .order_by(self.key, self.tie_breaker)[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            object_list = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            if after:
+                descending = descending.filter(self._after(*self.decode_cursor(after)))
+            rows = list(descending[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            object_list = rows[:self.per_page]
+            has_previous = bool(after)
+
+        next_cursor = self.encode_cursor(object_list[-1]) if has_next and object_list else None
+        previous_cursor = self.encode_cursor(object_list[0]) if has_previous and object_list else None
+        return CursorPage(object_list, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin switching pagination to CursorPaginator when get_cursor_pagination() is true;
+    pages are then requested with ?after=<cursor> and ?before=<cursor> instead of ?page=<number>
+    """
+
+    cursor_key = "creation_date"
+
+    def get_cursor_pagination(self):
+        return False
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.get_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size, key=self.cursor_key)
+        try:
+            page = paginator.page(after=self.request.GET.get("after"), before=self.request.GET.get("before"))
+        except InvalidPage as error:
+            raise Http404(str(error))
+        return paginator, page, page.object_list, page.has_other_pages()
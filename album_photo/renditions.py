@@ -0,0 +1,109 @@
+import hashlib
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# EXIF orientations that swap width and height once the image is transposed
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Pillow format, file extension and save options of every encoding a rendition can be stored in
+ENCODINGS = {
+    "jpeg": ("JPEG", "jpg", {"quality": 85, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 6}),
+    "avif": ("AVIF", "avif", {"quality": 60}),
+}
+
+
+def image_formats():
+    """
+    the encodings renditions are stored in: JPEG, which every browser shows, then those of PHOTO_RENDITION_FORMATS
+    that this Pillow build can write (AVIF needs Pillow 11.2+ built with libavif, or the pillow-avif-plugin)
+    """
+
+    Image.init()
+    return ["jpeg"] + [image_format for image_format in settings.PHOTO_RENDITION_FORMATS
+                       if ENCODINGS[image_format][0] in Image.SAVE]
+
+
+def rendition_key(name, image_format):
+    """key of a rendition in Photo.renditions: "grid" for the JPEG, "grid.webp" for the WebP one and so on"""
+
+    return name if image_format == "jpeg" else f"{name}.{image_format}"
+
+
+def rendition_keys():
+    formats = image_formats()
+    return [rendition_key(name, image_format) for name in settings.PHOTO_RENDITIONS for image_format in formats]
+
+
+def rendition_name(photo, name, content, extension="jpg"):
+    """a name unique to the content, so that rendition files never change and can be cached forever"""
+
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return os.path.join("renditions", str(photo.pk), f"{name}-{digest}.{extension}")
+
+
+def _open_scaled(photo, max_width):
+    """opens the original, letting JPEG decoder skip detail that the largest rendition does not need"""
+
+    image = Image.open(photo.path)
+    width, height = image.size
+    if image.getexif().get(0x0112) in ROTATED_ORIENTATIONS:
+        width, height = height, width
+    if width > max_width:
+        scale = max_width / width
+        image.draft("RGB", (round(image.size[0] * scale), round(image.size[1] * scale)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return image
+
+
+def generate_renditions(photo, force=False):
+    """
+    creates fixed-width renditions of the photo's original, in JPEG and in the formats of image_formats(), and
+    stores their paths on the photo. Renditions wider than the original are recorded as None, so templates fall
+    back to the original.
+    """
+
+    renditions = dict(photo.renditions)
+    if force:
+        for stale in renditions.values():
+            if stale:
+                default_storage.delete(stale)
+        renditions = {}
+    formats = image_formats()
+    missing = {name: width for name, width in settings.PHOTO_RENDITIONS.items()
+               if any(rendition_key(name, image_format) not in renditions for image_format in formats)}
+    if not missing:
+        return renditions
+
+    photo.path.open("rb")
+    try:
+        image = _open_scaled(photo, max(missing.values()))
+        # resizing from the largest rendition down reuses already downscaled pixels
+        for name, width in sorted(missing.items(), key=lambda item: item[1], reverse=True):
+            keys = {image_format: rendition_key(name, image_format) for image_format in formats
+                    if rendition_key(name, image_format) not in renditions}
+            if image.width <= width:
+                renditions.update(dict.fromkeys(keys.values()))
+                continue
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            for image_format, key in keys.items():
+                pillow_format, extension, options = ENCODINGS[image_format]
+                buffer = BytesIO()
+                image.save(buffer, pillow_format, **options)
+                target = rendition_name(photo, name, buffer.getvalue(), extension)
+                if not default_storage.exists(target):
+                    target = default_storage.save(target, ContentFile(buffer.getvalue()))
+                renditions[key] = target
+    finally:
+        photo.path.close()
+
+    photo.renditions = renditions
+    type(photo).objects.filter(pk=photo.pk).bump_version(renditions=renditions)
+    return renditions
@@ -0,0 +1,166 @@
+"""
+Read replicas. With more aliases than "default" in DATABASES, the GET requests of views using ReplicaReadMixin
+read from one of them, picked per request; everything else - writes, other views, management commands and jobs -
+uses the primary. A request that writes anything gets a short-lived cookie keeping its client on the primary for
+DATABASE_REPLICA_STICKY_SECONDS, so that a like, comment or upload shows up on the next page despite replication
+lag. A replica that cannot be reached is skipped for DATABASE_REPLICA_RETRY_SECONDS, and a read that fails on it
+is repeated on the primary.
+
+The state of the current request lives in a context variable set by album_photo.middleware.ReplicaMiddleware;
+it follows the request into sync_to_async threads, so the concurrent queries of the async views (see
+AsyncReplicaReadMixin) all read from the replica chosen for their request.
+"""
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, InterfaceError, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = "primary_db"
+
+_current_state = ContextVar("replica_state", default=None)
+# alias -> time.monotonic() until which the replica is not used
+_down_until = {}
+
+
+class ReplicaState:
+    """which replica the request reads from, if any, and whether it has written to the primary"""
+
+    def __init__(self):
+        self.alias = None
+        self.wrote = False
+
+
+@contextmanager
+def replica_state():
+    """the routing state of one request, for the code running within the block"""
+
+    state = ReplicaState()
+    token = _current_state.set(state)
+    try:
+        yield state
+    finally:
+        _current_state.reset(token)
+
+
+def mark_down(alias):
+    _down_until[alias] = time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS
+    try:
+        connections[alias].close()
+    except DatabaseError:
+        pass
+
+
+def choose_replica():
+    """a replica that accepts connections, chosen at random to spread the load, or None"""
+
+    now = time.monotonic()
+    aliases = [alias for alias in settings.DATABASE_REPLICAS if _down_until.get(alias, 0) <= now]
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as error:
+            logger.warning("Database replica %s is down, reading from the primary: %s", alias, error)
+            mark_down(alias)
+            continue
+        return alias
+    return None
+
+
+class ReplicaRouter:
+    """sends the reads of replica-routed requests to their replica, and every write to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _current_state.get()
+        if state is None or state.alias is None or state.wrote:
+            # explicitly the primary, otherwise Django would follow an instance read from a replica
+            return DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _current_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        return True if {obj1._state.db, obj2._state.db} <= aliases else None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+def _reads_from_replica(request):
+    """the routing state to set a replica on for the request, or None when it is to read from the primary"""
+
+    state = _current_state.get()
+    request.database_replica = None
+    if state is None or request.method not in ("GET", "HEAD") or STICKY_COOKIE in request.COOKIES:
+        return None
+    return state
+
+
+def _replica_failed(request, state, error):
+    logger.warning("Read from database replica %s failed, repeating it on the primary: %s", state.alias, error)
+    mark_down(state.alias)
+    state.alias = request.database_replica = None
+
+
+class ReplicaReadMixin:
+    """
+    runs GET and HEAD requests of a view against a replica, unless the client is within its sticky window after a
+    write; the response is rendered inside, as that is where a ListView's queryset is evaluated
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        state = _reads_from_replica(request)
+        if state is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        state.alias = request.database_replica = choose_replica()
+        if state.alias is None:
+            return super().dispatch(request, *args, **kwargs)
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            if callable(getattr(response, "render", None)):
+                response = response.render()
+            return response
+        except (OperationalError, InterfaceError) as error:
+            _replica_failed(request, state, error)
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            state.alias = None
+
+
+class AsyncReplicaReadMixin:
+    """
+    ReplicaReadMixin for the views of album_photo/async_views.py, whose dispatch() is a coroutine. The replica is
+    chosen before the handler runs, and the threads running its queries share the request's routing state.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        state = _reads_from_replica(request)
+        if state is None:
+            return await super().dispatch(request, *args, **kwargs)
+
+        # in the thread the handler closes connections in at the end of the request
+        state.alias = request.database_replica = await sync_to_async(choose_replica)()
+        if state.alias is None:
+            return await super().dispatch(request, *args, **kwargs)
+        try:
+            # the async views render their templates themselves
+            return await super().dispatch(request, *args, **kwargs)
+        except (OperationalError, InterfaceError) as error:
+            await sync_to_async(_replica_failed)(request, state, error)
+            return await super().dispatch(request, *args, **kwargs)
+        finally:
+            state.alias = None
@@ -0,0 +1,173 @@
+"""
+Full-text search over photo descriptions and the active comments of each photo. The index is a side table,
+album_photo_photo_search (created by migration 0014), holding one document per photo:
+
+* on PostgreSQL a weighted tsvector with a GIN index, queried with websearch_to_tsquery and ranked by ts_rank_cd;
+* on SQLite an FTS5 virtual table (rowid = photo id), ranked by bm25;
+* on other databases there is no index and search_photos falls back to an unranked icontains scan.
+
+Documents are rewritten by the reindex_photo job (album_photo.tasks) whenever a photo or its comments change,
+and rebuilt from scratch by the `rebuild_search_index` management command.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.db import connection, transaction
+from django.db.models import Q
+
+from album_photo.models import Comment, Photo
+from album_photo.pagination import CursorPage
+
+TABLE = "album_photo_photo_search"
+# weights of the two columns of the SQLite index, the description counting double as on PostgreSQL
+BM25_WEIGHTS = "2.0, 1.0"
+
+
+def _document(photo_id):
+    description = Photo.objects.filter(pk=photo_id).values_list("description", flat=True).first()
+    if description is None:
+        return None
+    comments = Comment.objects.filter(photo_id=photo_id, active=True).order_by("pk").values_list("content", flat=True)
+    return description, " ".join(comments)
+
+
+def reindex_photo(photo_id):
+    """rewrites the photo's document from its current description and active comments, or drops it"""
+
+    document = _document(photo_id)
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            if document is None:
+                cursor.execute(f"DELETE FROM {TABLE} WHERE photo_id = %s", [photo_id])
+            else:
+                cursor.execute(f"""
+                    INSERT INTO {TABLE} (photo_id, document)
+                    VALUES (%s, setweight(to_tsvector(%s::regconfig, %s), 'A')
+                                || setweight(to_tsvector(%s::regconfig, %s), 'B'))
+                    ON CONFLICT (photo_id) DO UPDATE SET document = EXCLUDED.document
+                """, [photo_id, settings.PHOTO_SEARCH_CONFIG, document[0], settings.PHOTO_SEARCH_CONFIG, document[1]])
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [photo_id])
+            if document is not None:
+                cursor.execute(f"INSERT INTO {TABLE} (rowid, description, comments) VALUES (%s, %s, %s)",
+                               [photo_id, *document])
+
+
+def rebuild_index(batch_size=1000):
+    """
+    recreates every document, a range of photo ids at a time with one INSERT ... SELECT each; in a single
+    transaction, so that searches keep seeing the old index until the new one is complete
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        if connection.vendor not in ("postgresql", "sqlite"):
+            return 0
+
+        if connection.vendor == "postgresql":
+            insert = f"""
+                INSERT INTO {TABLE} (photo_id, document)
+                SELECT p.id, setweight(to_tsvector(%s::regconfig, p.description), 'A')
+                             || setweight(to_tsvector(%s::regconfig, coalesce(string_agg(c.content, ' '), '')), 'B')
+                FROM album_photo_photo p LEFT JOIN album_photo_comment c ON c.photo_id = p.id AND c.active
+                WHERE p.id > %s AND p.id <= %s GROUP BY p.id
+            """
+            config = [settings.PHOTO_SEARCH_CONFIG] * 2
+        else:
+            insert = f"""
+                INSERT INTO {TABLE} (rowid, description, comments)
+                SELECT p.id, p.description, coalesce(group_concat(c.content, ' '), '')
+                FROM album_photo_photo p LEFT JOIN album_photo_comment c ON c.photo_id = p.id AND c.active
+                WHERE p.id > %s AND p.id <= %s GROUP BY p.id
+            """
+            config = []
+
+        indexed = 0
+        last_pk = 0
+        while True:
+            ids = list(Photo.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                return indexed
+            cursor.execute(insert, config + [last_pk, ids[-1]])
+            indexed += len(ids)
+            last_pk = ids[-1]
+
+
+def encode_cursor(rank, photo_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, photo_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rank, photo_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(photo_id)
+    except (TypeError, ValueError) as error:
+        raise InvalidPage("Invalid cursor") from error
+
+
+def _fts5_query(query):
+    # every word as a quoted string, so that FTS5 operators and punctuation in user input are taken literally
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+
+
+def _ranked_ids(query, after, limit):
+    """(photo id, rank) of the best matches, best first, following the `after` (rank, photo id) if given"""
+
+    if connection.vendor == "postgresql":
+        sql = f"""
+            SELECT photo_id, rank FROM (
+                SELECT photo_id, ts_rank_cd(document, query) AS rank
+                FROM {TABLE}, websearch_to_tsquery(%s::regconfig, %s) query
+                WHERE document @@ query
+            ) ranked
+        """
+        params = [settings.PHOTO_SEARCH_CONFIG, query]
+    else:
+        sql = f"""
+            SELECT photo_id, rank FROM (
+                SELECT rowid AS photo_id, -bm25({TABLE}, {BM25_WEIGHTS}) AS rank
+                FROM {TABLE} WHERE {TABLE} MATCH %s
+            ) ranked
+        """
+        params = [_fts5_query(query)]
+
+    if after is not None:
+        sql += " WHERE rank < %s OR (rank = %s AND photo_id < %s)"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY rank DESC, photo_id DESC LIMIT %s"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return cursor.fetchall()
+
+
+def _scanned_ids(query, after, limit):
+    """fallback for databases without an index: every match ranks the same, newest photo first"""
+
+    matches = Q(description__icontains=query) | Q(comment__active=True, comment__content__icontains=query)
+    photos = Photo.objects.filter(matches)
+    if after is not None:
+        photos = photos.filter(pk__lt=after[1])
+    ids = photos.order_by("-pk").values_list("pk", flat=True).distinct()[:limit]
+    return [(photo_id, 0.0) for photo_id in ids]
+
+
+def search_photos(query, after=None, per_page=21):
+    """a CursorPage of the photos matching `query`, best ranked first, continuing after the `after` cursor"""
+
+    query = query.strip()
+    if not query:
+        return CursorPage([], None, None)
+
+    after = decode_cursor(after) if after else None
+    find = _ranked_ids if connection.vendor in ("postgresql", "sqlite") else _scanned_ids
+    rows = find(query, after, per_page + 1)
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    photos = Photo.objects.visible().select_related("owner").in_bulk([photo_id for photo_id, _ in rows])
+    # a photo deleted since it was indexed, or of an account being deleted, is simply left out
+    object_list = [photos[photo_id] for photo_id, _ in rows if photo_id in photos]
+    next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if has_next else None
+    return CursorPage(object_list, next_cursor, None)
@@ -0,0 +1,126 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from album_photo import search, similarity
+from album_photo.hot import heat
+from album_photo.jobs import enqueue, enqueue_many
+from album_photo.models import Comment, Photo
+
+# photos whose deletion is in progress in this thread; their comments go away with them,
+# so there is no point in updating the counters of the rows about to be deleted
+_deleting = threading.local()
+
+
+def _deleting_photos():
+    if not hasattr(_deleting, "photos"):
+        _deleting.photos = set()
+    return _deleting.photos
+
+
+@contextmanager
+def photos_being_deleted(photo_ids):
+    """for deleting the comments of photos about to be deleted themselves, without touching their counters"""
+
+    deleting = _deleting_photos()
+    photo_ids = set(photo_ids) - deleting
+    deleting.update(photo_ids)
+    try:
+        yield
+    finally:
+        deleting.difference_update(photo_ids)
+
+
+# photos to reindex at the end of a batch_reindex() block of this thread, None outside of one
+_reindex = threading.local()
+
+
+@contextmanager
+def batch_reindex():
+    """
+    for deleting many comments at once: instead of a reindex_photo job for every comment, one per photo is queued
+    when the block ends
+    """
+
+    if getattr(_reindex, "photos", None) is not None:
+        # nested, the outer block queues them
+        yield
+        return
+    _reindex.photos = set()
+    try:
+        yield
+        photo_ids = _reindex.photos
+    finally:
+        _reindex.photos = None
+    enqueue_many("reindex_photo", [{"photo_id": photo_id} for photo_id in sorted(photo_ids)])
+
+
+def _queue_reindex(photo_id):
+    photos = getattr(_reindex, "photos", None)
+    if photos is None:
+        enqueue("reindex_photo", photo_id=photo_id)
+    else:
+        photos.add(photo_id)
+
+
+def _change_comment_count(photo_id, delta):
+    Photo.objects.filter(pk=photo_id).bump_version(comment_count=F("comment_count") + delta,
+                                                   **heat(delta * settings.PHOTO_HOT_WEIGHTS["comment"]))
+
+
+@receiver(post_save, sender=Photo)
+def photo_saved(sender, instance, **kwargs):
+    if instance.dhash is not None:
+        pk, value = instance.pk, similarity.from_db(instance.dhash)
+        transaction.on_commit(lambda: similarity.photo_index.add(pk, value))
+
+
+@receiver(pre_delete, sender=Photo)
+def photo_pre_delete(sender, instance, **kwargs):
+    _deleting_photos().add(instance.pk)
+
+
+@receiver(post_delete, sender=Photo)
+def photo_post_delete(sender, instance, **kwargs):
+    _deleting_photos().discard(instance.pk)
+    # PostgreSQL drops the search document by cascade, the SQLite index has no foreign key
+    search.reindex_photo(instance.pk)
+    if instance.dhash is not None:
+        pk, value = instance.pk, similarity.from_db(instance.dhash)
+        transaction.on_commit(lambda: similarity.photo_index.discard(pk, value))
+    transaction.on_commit(lambda: release_photo_files(instance))
+
+
+def release_photo_files(photo):
+    """
+    deletes the photo's renditions, which belong to it alone. The original is a blob that an upload of the same
+    content may be about to reference again, so it is left to delete_orphaned_media and its grace period.
+    """
+
+    for name in photo.renditions.values():
+        if name:
+            default_storage.delete(name)
+
+
+@receiver(post_save, sender=Comment)
+def comment_active_toggled(sender, instance, created, **kwargs):
+    """comment creation is counted by the view; here only changes of the active flag are"""
+
+    previous = getattr(instance, "_loaded_active", None)
+    if not created and previous is not None and previous != instance.active:
+        _change_comment_count(instance.photo_id, 1 if instance.active else -1)
+        _queue_reindex(instance.photo_id)
+    instance._loaded_active = instance.active
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.active and instance.photo_id not in _deleting_photos():
+        _change_comment_count(instance.photo_id, -1)
+        _queue_reindex(instance.photo_id)
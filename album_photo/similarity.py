@@ -0,0 +1,199 @@
+"""
+Near-duplicate detection: every photo gets a 64-bit difference hash (dHash) of its pixels, which stays within a few
+bits for resized or recompressed copies of a picture. Lookups go through a BK-tree over the hashes kept in memory
+by each process, so finding the photos within a Hamming distance takes a small part of the tree, not every row.
+"""
+import logging
+import threading
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.db import DatabaseError
+
+from album_photo.models import Photo
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+# rows below the highest id seen that are re-read on refresh: ids are handed out before commit, so a row of a
+# longer transaction can become visible after one with a higher id
+REFRESH_LOOKBACK = 1000
+FETCH_BATCH_SIZE = 500
+
+
+def dhash(file):
+    """dHash of an image file: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right neighbour"""
+
+    with Image.open(file) as image:
+        # the JPEG decoder can skip straight to a small scale, the hash only needs 9x8 pixels
+        image.draft("L", (64, 64))
+        image = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.LANCZOS)
+        pixels = list(image.getdata())
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = value << 1 | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value
+
+
+def to_db(value):
+    """the unsigned 64-bit hash as the signed value a BigIntegerField can hold"""
+
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_db(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes in the Hamming metric. Each node holds one hash and the ids of the photos
+    having it; children are keyed by their distance to the node, so by the triangle inequality a search within
+    `radius` only descends into children keyed `d - radius` to `d + radius`.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = [value, {item}, {}]
+            self.size += 1
+            return
+        node = self.root
+        while True:
+            node_distance = distance(value, node[0])
+            if node_distance == 0:
+                node[1].add(item)
+                return
+            child = node[2].get(node_distance)
+            if child is None:
+                node[2][node_distance] = [value, {item}, {}]
+                self.size += 1
+                return
+            node = child
+
+    def discard(self, value, item):
+        # nodes stay in place to keep the tree valid, they just stop matching
+        node = self.root
+        while node is not None:
+            node_distance = distance(value, node[0])
+            if node_distance == 0:
+                node[1].discard(item)
+                return
+            node = node[2].get(node_distance)
+
+    def search(self, value, radius):
+        """(distance, item) of every item whose hash is at most `radius` bits away, nearest first"""
+
+        found = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node = pending.pop()
+            node_distance = distance(value, node[0])
+            if node_distance <= radius:
+                found.extend((node_distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if node_distance - radius <= child_distance <= node_distance + radius:
+                    pending.append(child)
+        return sorted(found)
+
+
+class PhotoHashIndex:
+    """
+    the BK-tree of one process, built from the database by warm_up() at startup, or else on first use. Photos saved
+    or deleted by this process are added and removed by signals once committed; before each lookup, rows created
+    since by other processes are read in by id.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tree = None
+        self.last_pk = 0
+
+    def _load(self, photos):
+        for pk, value in photos.exclude(dhash=None).order_by("pk").values_list("pk", "dhash").iterator():
+            self.tree.add(from_db(value), pk)
+            self.last_pk = max(self.last_pk, pk)
+
+    def refresh(self):
+        with self.lock:
+            if self.tree is None:
+                self.tree = BKTree()
+                self._load(Photo.objects.all())
+            else:
+                self._load(Photo.objects.filter(pk__gt=self.last_pk - REFRESH_LOOKBACK))
+
+    def add(self, pk, value):
+        with self.lock:
+            if self.tree is not None:
+                self.tree.add(value, pk)
+                self.last_pk = max(self.last_pk, pk)
+
+    def discard(self, pk, value):
+        with self.lock:
+            if self.tree is not None:
+                self.tree.discard(value, pk)
+
+    def search(self, value, radius):
+        self.refresh()
+        with self.lock:
+            return self.tree.search(value, radius)
+
+    def clear(self):
+        with self.lock:
+            self.tree = None
+            self.last_pk = 0
+
+
+photo_index = PhotoHashIndex()
+
+
+def warm_up():
+    """
+    builds the index of this process before it serves requests, so the first lookup does not pay for reading every
+    hash; called by photoalbum/wsgi.py and photoalbum/asgi.py
+    """
+
+    try:
+        photo_index.refresh()
+    except DatabaseError:
+        # e.g. not migrated yet - the index is then built on first use
+        logger.warning("Could not build the similar photos index at startup", exc_info=True)
+
+
+def similar_photos(photo, max_distance=None, queryset=None, limit=None):
+    """
+    up to `limit` photos of `queryset` that look like `photo` (or like an image with the given hash), nearest
+    first, as (distance, photo); rows deleted by another process since they were indexed are left out
+    """
+
+    value = photo.dhash if isinstance(photo, Photo) else photo
+    if value is None:
+        # photos from before hashing, or whose image could not be decoded, have nothing to compare
+        return []
+    if isinstance(photo, Photo):
+        value = from_db(value)
+    if max_distance is None:
+        max_distance = settings.PHOTO_SIMILARITY_MAX_DISTANCE
+    if queryset is None:
+        queryset = Photo.objects.all()
+
+    matches = [(match_distance, pk) for match_distance, pk in photo_index.search(value, max_distance)
+               if not isinstance(photo, Photo) or pk != photo.pk]
+    found = []
+    # fetched in slices, nearest first: a plain image (a blank sky, a black frame) can match a large part of the album
+    for start in range(0, len(matches), FETCH_BATCH_SIZE):
+        batch = matches[start:start + FETCH_BATCH_SIZE]
+        photos = queryset.in_bulk([pk for _, pk in batch])
+        found.extend((match_distance, photos[pk]) for match_distance, pk in batch if pk in photos)
+        if limit is not None and len(found) >= limit:
+            return found[:limit]
+    return found
@@ -0,0 +1,29 @@
+// "Load more comments": fetches the next page of comments and appends it below the ones already shown.
+(function () {
+    var button = document.querySelector("[data-load-comments]");
+    if (!button) {
+        return;
+    }
+
+    button.addEventListener("click", function () {
+        button.disabled = true;
+        var url = button.getAttribute("data-load-comments") + "?after=" +
+            encodeURIComponent(button.getAttribute("data-after"));
+        fetch(url, {credentials: "same-origin"}).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        }).then(function (data) {
+            document.getElementById("comments").insertAdjacentHTML("beforeend", data.html);
+            if (data.next) {
+                button.setAttribute("data-after", data.next);
+                button.disabled = false;
+            } else {
+                button.remove();
+            }
+        }).catch(function () {
+            button.disabled = false;
+        });
+    });
+})();
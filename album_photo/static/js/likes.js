@@ -0,0 +1,47 @@
+// Likes and unlikes photos in place: a click on a [data-like-toggle] link POSTs to the JSON endpoint and
+// updates the link and every [data-like-count] of the photo. Any failure falls back to following the link.
+(function () {
+    var csrfToken = document.querySelector('meta[name="csrf-token"]').getAttribute("content");
+    var pending = {};
+
+    function render(link, liked, likeCount) {
+        link.setAttribute("data-liked", liked ? "true" : "false");
+        link.setAttribute("href", link.getAttribute(liked ? "data-unlike-url" : "data-like-url"));
+        link.textContent = liked ? "Unlike it" : "Like it";
+        document.querySelectorAll('[data-like-count="' + link.getAttribute("data-like-toggle") + '"]')
+            .forEach(function (counter) { counter.textContent = likeCount; });
+    }
+
+    document.addEventListener("click", function (event) {
+        var link = event.target.closest("[data-like-toggle]");
+        if (!link) {
+            return;
+        }
+        event.preventDefault();
+
+        var photoId = link.getAttribute("data-like-toggle");
+        if (pending[photoId]) {
+            // a double-click sends one request; the endpoints are idempotent anyway
+            return;
+        }
+        pending[photoId] = true;
+
+        var liked = link.getAttribute("data-liked") === "true";
+        fetch(link.getAttribute(liked ? "data-unlike-api" : "data-like-api"), {
+            method: "POST",
+            headers: {"X-CSRFToken": csrfToken},
+            credentials: "same-origin"
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        }).then(function (data) {
+            render(link, data.liked, data.like_count);
+        }).catch(function () {
+            window.location.href = link.getAttribute("href");
+        }).finally(function () {
+            delete pending[photoId];
+        });
+    });
+})();
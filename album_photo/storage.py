@@ -0,0 +1,84 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIRECTORY = "blobs"
+# uploads being hashed, not yet renamed to their blob; never served
+TEMPORARY_DIRECTORY = BLOB_DIRECTORY + "/tmp"
+
+
+def canonical_extension(name):
+    """the usual extension for the file's type (.jpg for .jpeg, .JPG or .jpe), so that equal content gets one name"""
+
+    extension = os.path.splitext(name)[1].lower()
+    content_type, _ = mimetypes.guess_type("file" + extension)
+    return (content_type and mimetypes.guess_extension(content_type)) or extension
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    file system storage keeping every distinct content once, under blobs/<ab>/<cd>/<sha256><extension>.
+    The upload is hashed while it is streamed to a temporary file; if a blob with the same digest is already
+    stored, the temporary file is dropped and the existing name is returned, so duplicates cost no extra bytes.
+    Blobs are shared between rows, so they are only ever deleted by album_photo.orphans once no row references them.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # the final name is derived from the content in _save, the uploaded name does not matter
+        return name
+
+    def blob_name(self, digest, extension):
+        return "/".join((BLOB_DIRECTORY, digest[:2], digest[2:4], digest + extension))
+
+    def _save(self, name, content):
+        extension = canonical_extension(name)
+        digest = hashlib.sha256()
+
+        if hasattr(content, "temporary_file_path"):
+            # large uploads are already on disk, hash them and move the file instead of copying it
+            temporary_path = content.temporary_file_path()
+            with open(temporary_path, "rb") as uploaded:
+                for chunk in iter(lambda: uploaded.read(64 * 1024), b""):
+                    digest.update(chunk)
+            move = file_move_safe
+        else:
+            temporary_directory = self.path(TEMPORARY_DIRECTORY)
+            os.makedirs(temporary_directory, exist_ok=True)
+            fd, temporary_path = tempfile.mkstemp(dir=temporary_directory)
+            try:
+                with os.fdopen(fd, "wb") as temporary:
+                    for chunk in content.chunks():
+                        digest.update(chunk)
+                        temporary.write(chunk)
+            except BaseException:
+                os.remove(temporary_path)
+                raise
+            move = os.replace
+
+        name = self.blob_name(digest.hexdigest(), extension)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            if move is os.replace:
+                os.remove(temporary_path)
+            # a fresh mtime keeps delete_orphaned_media off a blob that a row is about to reference again
+            os.utime(full_path)
+            return name
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        try:
+            move(temporary_path, full_path)
+        except FileExistsError:
+            # the same content was stored concurrently, which is just as good
+            return name
+        # mkstemp creates files readable by the owner only
+        os.chmod(full_path, self.file_permissions_mode or 0o644)
+        return name
+
+
+photo_storage = ContentAddressedStorage()
@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+
+from album_photo.accounts import purge_account as purge_account_batches
+from album_photo.jobs import enqueue, task
+from album_photo.models import AccountDeletion, Photo
+from album_photo.renditions import generate_renditions
+from album_photo import search, timelines
+
+
+def mark_photo_failed(photo_id):
+    Photo.objects.filter(pk=photo_id).update(processing_status=Photo.PROCESSING_FAILED)
+
+
+@task(on_failure=mark_photo_failed)
+def process_photo(photo_id):
+    """upload-time work on a new photo; until it is done, templates show the original"""
+
+    photo = Photo.objects.filter(pk=photo_id).first()
+    if photo is None:
+        # deleted before the job got its turn
+        return
+
+    generate_renditions(photo)
+    Photo.objects.filter(pk=photo_id).update(processing_status=Photo.PROCESSING_READY)
+
+
+@task()
+def reindex_photo(photo_id):
+    """brings the photo's full-text search document up to date with its description and comments"""
+
+    search.reindex_photo(photo_id)
+
+
+@task()
+def purge_account(deletion_id):
+    """deletes a soft-deleted account's content for a while, then hands the rest over to a fresh job"""
+
+    deletion = AccountDeletion.objects.filter(pk=deletion_id, finished_at=None).first()
+    if deletion is None:
+        return
+
+    # short runs keep each job well within JOBS_LOCK_TIMEOUT, so no second worker reclaims it midway
+    if not purge_account_batches(deletion, deadline=time.monotonic() + settings.ACCOUNT_PURGE_JOB_SECONDS):
+        enqueue("purge_account", deletion_id=deletion_id)
+
+
+@task()
+def fan_out_photo(photo_id):
+    """copies a new photo into the home timelines of its owner and their followers"""
+
+    timelines.fan_out_photo(photo_id)
+
+
+@task()
+def backfill_timeline(follower_id, followed_id):
+    timelines.backfill_timeline(follower_id, followed_id)
+
+
+@task()
+def trim_timeline(follower_id, followed_id):
+    timelines.trim_timeline(follower_id, followed_id)
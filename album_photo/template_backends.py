@@ -0,0 +1,36 @@
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from album_photo.middleware import current_timing
+
+
+class TimedTemplate(Template):
+    """adds the time spent rendering to the current request's Server-Timing, see ServerTimingMiddleware"""
+
+    def render(self, context=None, request=None):
+        timing = current_timing()
+        if timing is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_seconds += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    the Django template engine with timed top-level templates; included ones are rendered inside them. Set as
+    the BACKEND in TEMPLATES, so timing is limited to this engine instead of patching Django's Template class.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
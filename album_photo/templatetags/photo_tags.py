@@ -0,0 +1,27 @@
+from django import template
+
+from album_photo.renditions import image_formats
+
+register = template.Library()
+
+
+@register.filter
+def rendition(photo, name):
+    """usage: {{ photo|rendition:"grid" }} - url of the named rendition, or of the original if it is missing"""
+
+    return photo.rendition(name)
+
+
+@register.inclusion_tag("picture.html")
+def picture(photo, name, css_class="", alt=""):
+    """
+    usage: {% picture photo "grid" "img-fluid rounded" "description" %} - <picture> offering the AVIF and WebP
+    encodings of the named rendition to browsers that accept them, with the JPEG one (or the original) as <img>
+    """
+
+    sources = []
+    for image_format in image_formats()[1:]:
+        url = photo.rendition(name, image_format)
+        if url:
+            sources.append({"type": f"image/{image_format}", "url": url})
+    return {"sources": sources, "src": photo.rendition(name), "css_class": css_class, "alt": alt}
@@ -1,14 +1,48 @@
+import base64
+import json
 import os
+import random
 import shutil
+import sqlite3
+import time
+import zipfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
+from asgiref.sync import sync_to_async
+from PIL import Image
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, override_settings
-from django.test import Client
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncClient, Client
 from django.urls import reverse
+from django.views.generic.base import View
+from django.utils import timezone
 
+from album_photo import replicas
+from album_photo.accounts import delete_account, purge_account
+from album_photo.benchmark import async_views, run_benchmark, run_throughput, seed, uncovered_routes
+from album_photo.cache import cache_stats, reset_cache_stats
+from album_photo.checks import async_views_connections
+from album_photo.hot import heat, move_epoch
 from album_photo.forms import AddPhotoForm, CustomUserChangeForm, CommentCreationForm, EditPhotoForm
-from album_photo.models import Photo, Comment
+from album_photo.jobs import claim_jobs, enqueue, execute_job, prune_jobs, task
+from album_photo.likes import like_photo
+from album_photo.models import AccountDeletion, Follow, HotEpoch, Photo, Comment, Job, TimelineEntry
+from album_photo.renditions import rendition_keys
+from album_photo.replicas import STICKY_COOKIE, ReplicaReadMixin, ReplicaRouter, mark_down, replica_state
+from album_photo.search import rebuild_index, search_photos
+from album_photo.similarity import BKTree, dhash, distance, from_db, photo_index, to_db, warm_up
+from album_photo.timelines import fan_out_photo, follow
+from album_photo.views import ViewPhotos
 
 
 TEST_DIR = 'test_data'
@@ -192,6 +226,14 @@ class ViewsAppLogicTestClass(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'edit_photo_tmp.html')
 
+    def test_EditPhoto_rerenders_invalid_form_with_the_photo(self):
+        self.c.login(username="TestUser", password="testusertestuser")
+        response = self.c.post(reverse('edit_photo', args=(self.p.pk,)), {"description": ""})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'edit_photo_tmp.html')
+        self.assertEqual(response.context["photo"], self.p)
+        self.assertTrue(response.context["form"].errors)
+
     def test_DeletePhoto_uses_correct_template_and_has_desired_location(self):
         self.c.login(username="TestUser", password="testusertestuser")
         response = self.c.get(reverse('delete_photo', args=(self.p.pk,)))
@@ -225,3 +267,1394 @@ class ViewsAppLogicTestClass(TestCase):
         response = self.c.get(reverse('one_photo', args=(self.p.pk,)))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'view_one_photo_tmp.html')
+
+
+@override_settings(MEDIA_ROOT=my_media_root, PHOTO_RENDITIONS={"grid": 100, "detail": 200, "full": 1000},
+                   JOBS_RUN_INLINE=True)
+class RenditionsTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def upload(self):
+        with open("photoalbum/tests_data/test_image.jpeg", "rb") as test_photo:
+            img = SimpleUploadedFile('image.jpg', content=test_photo.read(), content_type='image/jpeg')
+        self.c.post(reverse("add_photo"), {"path": img, "description": "Uploaded photo"})
+        return Photo.objects.get(description="Uploaded photo")
+
+    def test_AddPhoto_generates_renditions_narrower_than_original(self):
+        photo = self.upload()
+        self.assertEqual(Image.open(os.path.join(my_media_root, photo.renditions["grid"])).width, 100)
+        self.assertEqual(Image.open(os.path.join(my_media_root, photo.renditions["detail"])).width, 200)
+        self.assertIsNone(photo.renditions["full"])
+
+    def test_rendition_falls_back_to_original(self):
+        photo = self.upload()
+        self.assertIn(photo.renditions["grid"], photo.rendition("grid"))
+        self.assertEqual(photo.rendition("full"), photo.path.url)
+        photo.renditions = {}
+        self.assertEqual(photo.rendition("grid"), photo.path.url)
+
+    def test_generate_renditions_command_backfills_missing_renditions(self):
+        photo = self.upload()
+        Photo.objects.filter(pk=photo.pk).update(renditions={})
+        call_command("generate_renditions", stdout=StringIO())
+        photo.refresh_from_db()
+        self.assertEqual(set(photo.renditions), set(rendition_keys()))
+        self.assertTrue({"grid", "grid.webp", "full.webp"} <= set(photo.renditions))
+
+    @override_settings(PHOTO_RENDITION_FORMATS=["webp"])
+    def test_generate_renditions_command_backfills_new_formats(self):
+        with override_settings(PHOTO_RENDITION_FORMATS=[]):
+            photo = self.upload()
+        self.assertEqual(set(photo.renditions), {"grid", "detail", "full"})
+        call_command("generate_renditions", stdout=StringIO())
+        photo.refresh_from_db()
+        self.assertEqual(Image.open(os.path.join(my_media_root, photo.renditions["grid.webp"])).format, "WEBP")
+        self.assertIsNone(photo.renditions["full.webp"])
+
+    def test_rendition_of_format_is_none_when_missing(self):
+        photo = self.upload()
+        self.assertIn(photo.renditions["detail.webp"], photo.rendition("detail", "webp"))
+        self.assertIsNone(photo.rendition("full", "webp"))
+
+    def test_ViewPhotos_uses_grid_rendition(self):
+        photo = self.upload()
+        response = self.c.get(reverse("view_photos"))
+        self.assertContains(response, f'<img src="{photo.rendition("grid")}"')
+        self.assertContains(response, f'<source srcset="{photo.rendition("grid", "webp")}" type="image/webp">')
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+class FeedQueriesTestClass(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                 email="testuser@example.com")
+        cls.fans = [User.objects.create_user(username=f"Fan{i}", password="fanfanfanfan") for i in range(3)]
+
+    def setUp(self):
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def add_photos(self, count, likes, comments):
+        for i in range(count):
+            photo = Photo.objects.create(path="image.jpg", description=f"Photo {i}", owner=self.fans[i % 3])
+            photo.likes.add(*self.fans[:likes])
+            for j in range(comments):
+                Comment.objects.create(content=f"Comment {j}", photo=photo, author=self.fans[j % 3])
+        Photo.objects.recount()
+
+    def count_feed_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(reverse("view_photos"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_ViewPhotos_query_count_does_not_depend_on_page_size(self):
+        self.add_photos(1, likes=0, comments=0)
+        baseline = self.count_feed_queries()
+        self.add_photos(20, likes=3, comments=4)
+        self.assertEqual(self.count_feed_queries(), baseline)
+
+    def test_ViewPhotos_shows_counts_and_like_state(self):
+        self.add_photos(1, likes=2, comments=3)
+        like_photo(self.test_user, Photo.objects.get().pk)
+        response = self.c.get(reverse("view_photos"))
+        photo = response.context["photos"][0]
+        self.assertEqual((photo.like_count, photo.comment_count), (3, 3))
+        self.assertEqual(response.context["liked_photo_ids"], {photo.pk})
+        self.assertContains(response, "Unlike it")
+
+    def test_ViewPhotos_loads_like_state_in_one_query(self):
+        self.add_photos(21, likes=3, comments=0)
+        like_photo(self.test_user, Photo.objects.first().pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(reverse("view_photos"))
+        self.assertEqual(len([query for query in queries if "album_photo_photo_likes" in query["sql"]]), 1)
+        self.assertEqual(len(response.context["liked_photo_ids"]), 1)
+
+    def test_OnePhoto_shows_like_state(self):
+        self.add_photos(1, likes=0, comments=0)
+        photo = Photo.objects.get()
+        response = self.c.get(reverse("one_photo", args=(photo.pk,)))
+        self.assertContains(response, "Like it")
+        like_photo(self.test_user, photo.pk)
+        response = self.c.get(reverse("one_photo", args=(photo.pk,)))
+        self.assertContains(response, "Unlike it")
+
+
+class MyPhotosTestClass(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                 email="testuser@example.com")
+        cls.other_user = User.objects.create_user(username="OtherUser", password="otheruserotheruser")
+        for i in range(22):
+            Photo.objects.create(path="image.jpg", description=f"Photo {i}", owner=cls.test_user, like_count=i)
+        Photo.objects.create(path="image.jpg", description="Not mine", owner=cls.other_user)
+
+    def setUp(self):
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def test_MyPhotos_is_paginated_newest_first(self):
+        response = self.c.get(reverse("my_photos"))
+        photos = response.context["photos"]
+        self.assertEqual(len(photos), 21)
+        self.assertEqual(photos[0].like_count, 21)
+        self.assertContains(response, "?page=2")
+        response = self.c.get(reverse("my_photos"), {"page": 2})
+        self.assertEqual([photo.like_count for photo in response.context["photos"]], [0])
+
+    def test_MyPhotos_loads_only_card_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(reverse("my_photos"))
+        photo = response.context["photos"][0]
+        self.assertEqual(photo.get_deferred_fields(),
+                         {"description", "owner_id", "processing_status", "dhash", "hot_score",
+                          "hot_epoch"})
+        self.assertEqual(len([query for query in queries if "album_photo_photo" in query["sql"]]), 2)
+
+    @override_settings(PHOTO_FEED_CURSOR_PAGINATION=True)
+    def test_MyPhotos_with_cursor_pagination(self):
+        first = self.c.get(reverse("my_photos")).context["page_obj"]
+        response = self.c.get(reverse("my_photos"), {"after": first.next_cursor})
+        self.assertEqual([photo.description for photo in response.context["photos"]], ["Photo 0"])
+
+
+class CountersTestClass(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                 email="testuser@example.com")
+        cls.p = Photo.objects.create(path="image.jpg", description="This is description of test image",
+                                     owner=cls.test_user)
+
+    def setUp(self):
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def counters(self):
+        self.p.refresh_from_db()
+        return self.p.like_count, self.p.comment_count
+
+    def test_like_and_unlike_update_like_count_once(self):
+        self.c.get(reverse("like", args=(self.p.pk,)), HTTP_REFERER="/")
+        self.c.get(reverse("like", args=(self.p.pk,)), HTTP_REFERER="/")
+        self.assertEqual(self.counters(), (1, 0))
+        self.c.get(reverse("unlike", args=(self.p.pk,)), HTTP_REFERER="/")
+        self.c.get(reverse("unlike", args=(self.p.pk,)), HTTP_REFERER="/")
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_comment_count_follows_new_deactivated_and_deleted_comments(self):
+        self.c.post(reverse("one_photo", args=(self.p.pk,)), {"content": "First"})
+        self.c.post(reverse("one_photo", args=(self.p.pk,)), {"content": "Second"})
+        self.assertEqual(self.counters(), (0, 2))
+
+        comment = Comment.objects.get(content="First")
+        comment.active = False
+        comment.save()
+        self.assertEqual(self.counters(), (0, 1))
+        comment.delete()
+        self.assertEqual(self.counters(), (0, 1))
+        Comment.objects.get(content="Second").delete()
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_like_api_is_idempotent_and_returns_json(self):
+        for _ in range(2):
+            response = self.c.post(reverse("like_api", args=(self.p.pk,)))
+            self.assertEqual(response.json(), {"liked": True, "like_count": 1})
+        for _ in range(2):
+            response = self.c.post(reverse("unlike_api", args=(self.p.pk,)))
+            self.assertEqual(response.json(), {"liked": False, "like_count": 0})
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_like_api_rejects_get_anonymous_users_and_missing_photos(self):
+        self.assertEqual(self.c.get(reverse("like_api", args=(self.p.pk,))).status_code, 405)
+        self.assertEqual(self.c.post(reverse("like_api", args=(self.p.pk + 1,))).status_code, 404)
+        self.assertFalse(Photo.likes.through.objects.exists())
+        self.c.logout()
+        self.assertEqual(self.c.post(reverse("like_api", args=(self.p.pk,))).status_code, 403)
+
+    def test_like_fallback_without_referer_redirects_to_photo(self):
+        response = self.c.get(reverse("like", args=(self.p.pk,)))
+        self.assertRedirects(response, reverse("one_photo", args=(self.p.pk,)))
+
+    def test_recount_photo_counters_repairs_drift(self):
+        self.p.likes.add(self.test_user)
+        Comment.objects.create(content="Not counted", photo=self.p, author=self.test_user)
+        Comment.objects.create(content="Inactive", photo=self.p, author=self.test_user, active=False)
+        call_command("recount_photo_counters", batch_size=1, stdout=StringIO())
+        self.assertEqual(self.counters(), (1, 1))
+
+
+@override_settings(PHOTO_HOT_WEIGHTS={"upload": 1.0, "like": 1.0, "comment": 2.0}, PHOTO_HOT_HALF_LIFE=3600)
+class HotPhotosTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.photos = [Photo.objects.create(path="image.jpg", description=f"Photo {i}", owner=self.test_user)
+                       for i in range(4)]
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def hot_feed(self, **params):
+        response = self.c.get(reverse("hot_photos"), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_likes_and_comments_rank_photos(self):
+        first, second, third, plain = self.photos
+        self.c.post(reverse("one_photo", args=(first.pk,)), {"content": "Great"})
+        like_photo(self.test_user, second.pk)
+        like_photo(self.test_user, third.pk)
+        self.c.get(reverse("unlike", args=(third.pk,)))
+        self.assertEqual(list(self.hot_feed().context["photos"]), [first, second, plain, third])
+
+        Comment.objects.get().delete()
+        self.assertEqual(list(self.hot_feed().context["photos"])[0], second)
+
+    def test_later_events_weigh_more_and_moving_the_epoch_keeps_the_order(self):
+        epoch = HotEpoch.objects.get().timestamp
+        first, second = self.photos[:2]
+        Photo.objects.filter(pk=first.pk).update(**heat(3, now=epoch))
+        Photo.objects.filter(pk=second.pk).update(**heat(1, now=epoch + 2 * 3600))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertAlmostEqual(first.hot_score, 3)
+        self.assertAlmostEqual(second.hot_score, 4)
+
+        move_epoch(now=epoch + 3600, batch_size=1)
+        self.assertEqual(HotEpoch.objects.get().timestamp, epoch + 3600)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertAlmostEqual(first.hot_score, 1.5)
+        self.assertAlmostEqual(second.hot_score, 2)
+
+    def test_events_during_the_decay_pass_count_at_their_row_epoch(self):
+        epoch = HotEpoch.objects.get().timestamp
+        first, second = self.photos[:2]
+        Photo.objects.filter(pk__in=[first.pk, second.pk]).update(**heat(3, now=epoch))
+        # the pass has moved the epoch and rescaled the second photo, but not the first one yet
+        move_epoch(now=epoch + 3600)
+        Photo.objects.filter(pk=first.pk).update(hot_score=3, hot_epoch=epoch)
+        Photo.objects.filter(pk__in=[first.pk, second.pk]).update(**heat(1, now=epoch + 3600))
+        move_epoch(now=epoch + 3600)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertAlmostEqual(first.hot_score, 2.5)
+        self.assertAlmostEqual(second.hot_score, 2.5)
+        self.assertEqual(first.hot_epoch, epoch + 3600)
+
+    def test_pages_are_index_range_scans_walked_by_cursor(self):
+        Photo.objects.bulk_create(Photo(path="image.jpg", description=f"Liked {i}", owner=self.test_user,
+                                        hot_score=i % 7) for i in range(30))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.hot_feed()
+        [page_query] = [query["sql"] for query in queries if '"hot_score" DESC' in query["sql"]]
+        self.assertNotIn("COUNT(", page_query)
+        self.assertNotIn("album_photo_comment", page_query)
+
+        seen = [photo.pk for photo in response.context["photos"]]
+        response = self.hot_feed(after=response.context["page_obj"].next_cursor)
+        seen += [photo.pk for photo in response.context["photos"]]
+        self.assertIsNone(response.context["page_obj"].next_cursor)
+        self.assertEqual(seen, list(Photo.objects.order_by("-hot_score", "-id").values_list("pk", flat=True)))
+
+
+@override_settings(JOBS_RUN_INLINE=True, TIMELINE_FAN_OUT_LIMIT=3, TIMELINE_BATCH_SIZE=2)
+class TimelinesTestClass(TestCase):
+    def setUp(self):
+        self.test_user, self.friend, self.stranger = [
+            User.objects.create_user(username=name, password="testusertestuser", email=f"{name}@example.com")
+            for name in ("TestUser", "Friend", "Stranger")]
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def upload(self, owner, description="Photo"):
+        photo = Photo.objects.create(path="image.jpg", description=description, owner=owner)
+        enqueue("fan_out_photo", photo_id=photo.pk)
+        return photo
+
+    def home_feed(self, **params):
+        response = self.c.get(reverse("home_feed"), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_follow_backfills_and_uploads_fan_out(self):
+        old = self.upload(self.friend, "Old")
+        self.upload(self.stranger)
+        response = self.c.post(reverse("follow", args=(self.friend.pk,)))
+        self.assertRedirects(response, reverse("home_feed"), fetch_redirect_response=False)
+        self.assertEqual(list(self.home_feed().context["photos"]), [old])
+
+        new = self.upload(self.friend, "New")
+        own = self.upload(self.test_user, "Own")
+        self.assertEqual(list(self.home_feed().context["photos"]), [own, new, old])
+        self.assertFalse(follow(self.test_user, self.friend))
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_unfollow_trims_the_timeline(self):
+        follow(self.test_user, self.friend)
+        photos = [self.upload(self.friend) for _ in range(5)]
+        own = self.upload(self.test_user)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.test_user).count(), len(photos) + 1)
+
+        self.c.post(reverse("unfollow", args=(self.friend.pk,)))
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(list(self.home_feed().context["photos"]), [own])
+
+    def test_large_accounts_are_fanned_out_on_read(self):
+        followers = [User.objects.create_user(username=f"Follower{i}", password="x") for i in range(2)]
+        for user in [self.test_user] + followers:
+            follow(user, self.friend)
+        photo = self.upload(self.friend)
+        self.assertFalse(Follow.objects.filter(fan_out_on_read=False).exists())
+        # only the owner's own entry was written
+        self.assertEqual(list(TimelineEntry.objects.filter(photo=photo).values_list("user", flat=True)),
+                         [self.friend.pk])
+
+        own = self.upload(self.test_user)
+        self.assertEqual(list(self.home_feed().context["photos"]), [own, photo])
+
+    def test_pages_are_one_query_walked_by_cursor(self):
+        for user in ("Follower0", "Follower1", "Follower2"):
+            follow(User.objects.create_user(username=user, password="x"), self.stranger)
+        follow(self.test_user, self.stranger)
+        follow(self.test_user, self.friend)
+        for i in range(30):
+            self.upload((self.friend, self.stranger, self.test_user)[i % 3], f"Photo {i}")
+        self.assertTrue(Follow.objects.get(follower=self.test_user, followed=self.stranger).fan_out_on_read)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.home_feed()
+        [page_query] = [query["sql"] for query in queries if "UNION" in query["sql"]]
+        self.assertIn('"album_photo_photo"', page_query)
+        self.assertNotIn("COUNT(", page_query)
+
+        seen = [photo.pk for photo in response.context["photos"]]
+        response = self.home_feed(after=response.context["page_obj"].next_cursor)
+        seen += [photo.pk for photo in response.context["photos"]]
+        self.assertIsNone(response.context["page_obj"].next_cursor)
+        self.assertEqual(seen, list(Photo.objects.order_by("-creation_date", "-id").values_list("pk", flat=True)))
+        self.assertEqual(self.c.get(reverse("home_feed"), {"after": "nonsense"}).status_code, 404)
+
+
+@override_settings(PHOTO_FEED_CURSOR_PAGINATION=True)
+class CursorPaginationTestClass(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                 email="testuser@example.com")
+        Photo.objects.bulk_create(Photo(path="image.jpg", description=f"Photo {i}", owner=cls.test_user)
+                                  for i in range(45))
+
+    def setUp(self):
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def test_ViewPhotos_walks_all_photos_with_cursors_newest_first(self):
+        seen = []
+        response = self.c.get(reverse("view_photos"))
+        while True:
+            seen += [photo.pk for photo in response.context["photos"]]
+            if not response.context["page_obj"].has_next():
+                break
+            response = self.c.get(reverse("view_photos"), {"after": response.context["page_obj"].next_cursor})
+        expected = list(Photo.objects.order_by("-creation_date", "-id").values_list("pk", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_ViewPhotos_goes_back_to_previous_page(self):
+        first = self.c.get(reverse("view_photos"))
+        second = self.c.get(reverse("view_photos"), {"after": first.context["page_obj"].next_cursor})
+        self.assertContains(second, "?before=")
+        back = self.c.get(reverse("view_photos"), {"before": second.context["page_obj"].previous_cursor})
+        self.assertEqual(list(back.context["photos"]), list(first.context["photos"]))
+        self.assertFalse(back.context["page_obj"].has_previous())
+
+    def test_ViewPhotos_skips_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.c.get(reverse("view_photos"))
+        self.assertFalse([query for query in queries if "COUNT(" in query["sql"]])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.c.get(reverse("view_photos"), {"after": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_invalid_tie_breaker_returns_404(self):
+        photo = Photo.objects.first()
+        for payload in (["2020-01-01T00:00:00Z", "abc"], ["2020-01-01T00:00:00Z", None],
+                        ["2020-01-01T00:00:00Z", [1]], {"a": 1, "b": 2}, ["2020-01-01T00:00:00Z"]):
+            cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            requests = [(reverse("view_photos"), "after"), (reverse("view_photos"), "before"),
+                        (reverse("my_photos"), "after"), (reverse("my_photos"), "before"),
+                        (reverse("photo_comments", args=(photo.pk,)), "after"), (reverse("home_feed"), "after")]
+            for url, direction in requests:
+                response = self.c.get(url, {direction: cursor})
+                self.assertEqual(response.status_code, 404, (url, direction, payload))
+
+
+@override_settings(MEDIA_ROOT=my_media_root)
+class ContentAddressedStorageTestClass(TransactionTestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def upload(self, name, description):
+        with open("photoalbum/tests_data/test_image.jpeg", "rb") as test_photo:
+            img = SimpleUploadedFile(name, content=test_photo.read(), content_type='image/jpeg')
+        self.c.post(reverse("add_photo"), {"path": img, "description": description})
+        return Photo.objects.get(description=description)
+
+    def test_duplicate_uploads_share_one_hash_named_blob(self):
+        first = self.upload("image.jpg", "First")
+        second = self.upload("copy.jpg", "Second")
+        self.assertEqual(first.path.name, second.path.name)
+        self.assertTrue(first.path.name.startswith("blobs/"))
+        self.assertTrue(os.path.exists(first.path.path))
+
+    def test_extension_variants_share_one_blob(self):
+        first = self.upload("image.jpeg", "First")
+        second = self.upload("copy.JPG", "Second")
+        self.assertEqual(first.path.name, second.path.name)
+        self.assertTrue(first.path.name.endswith(".jpg"))
+
+    def test_blob_is_left_to_the_orphan_collector(self):
+        first = self.upload("image.jpg", "First")
+        second = self.upload("copy.jpg", "Second")
+        first.delete()
+        second.delete()
+        # an upload of the same content may be reusing the blob right now
+        self.assertTrue(os.path.exists(second.path.path))
+        call_command("delete_orphaned_media", "--grace", "0", stdout=StringIO())
+        self.assertFalse(os.path.exists(second.path.path))
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+@task(on_failure=lambda photo_id: Photo.objects.filter(pk=photo_id).update(description="gave up"))
+def failing_test_task(photo_id):
+    raise ValueError("Broken")
+
+
+@override_settings(MEDIA_ROOT=my_media_root)
+class JobsTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def test_AddPhoto_enqueues_processing_job(self):
+        with open("photoalbum/tests_data/test_image.jpeg", "rb") as test_photo:
+            img = SimpleUploadedFile('image.jpg', content=test_photo.read(), content_type='image/jpeg')
+        self.c.post(reverse("add_photo"), {"path": img, "description": "Uploaded photo"})
+        photo = Photo.objects.get()
+        self.assertEqual(photo.processing_status, Photo.PROCESSING_PENDING)
+
+        self.assertEqual(sorted(Job.objects.values_list("task", flat=True)),
+                         ["fan_out_photo", "process_photo", "reindex_photo"])
+        job = Job.objects.get(task="process_photo")
+        self.assertEqual((job.arguments, job.status), ({"photo_id": photo.pk}, Job.PENDING))
+        self.assertIn(job.pk, claim_jobs(10))
+        self.assertEqual(claim_jobs(10), [])
+        self.assertEqual(execute_job(job.pk), Job.DONE)
+        photo.refresh_from_db()
+        self.assertEqual(photo.processing_status, Photo.PROCESSING_READY)
+
+    def test_failing_job_is_retried_then_marked_failed(self):
+        photo = Photo.objects.create(path="image.jpg", description="Photo", owner=self.test_user)
+        job = enqueue("failing_test_task", max_attempts=2, photo_id=photo.pk)
+
+        self.assertEqual(execute_job(claim_jobs(10)[0]), Job.PENDING)
+        job.refresh_from_db()
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("Broken", job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(execute_job(claim_jobs(10)[0]), Job.FAILED)
+        photo.refresh_from_db()
+        self.assertEqual(photo.description, "gave up")
+
+    def test_unknown_and_abandoned_jobs_fail_instead_of_coming_back(self):
+        unknown = Job.objects.create(task="renamed_task")
+        self.assertEqual(execute_job(claim_jobs(10)[0]), Job.FAILED)
+        unknown.refresh_from_db()
+        self.assertIn("Unknown task", unknown.last_error)
+
+        photo = Photo.objects.create(path="image.jpg", description="Photo", owner=self.test_user)
+        stale = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT + 1)
+        crashed = Job.objects.create(task="failing_test_task", arguments={"photo_id": photo.pk},
+                                     status=Job.RUNNING, locked_at=stale, attempts=1, max_attempts=2)
+        self.assertEqual(claim_jobs(10), [crashed.pk])
+        Job.objects.filter(pk=crashed.pk).update(locked_at=stale)
+        self.assertEqual(claim_jobs(10), [])
+        crashed.refresh_from_db()
+        photo.refresh_from_db()
+        self.assertEqual((crashed.status, photo.description), (Job.FAILED, "gave up"))
+
+    @override_settings(JOBS_KEEP_DONE=60)
+    def test_prune_jobs_deletes_old_finished_jobs(self):
+        old = timezone.now() - timedelta(seconds=61)
+        Job.objects.bulk_create([Job(task="process_photo", status=Job.DONE, run_after=old) for _ in range(3)]
+                                + [Job(task="process_photo", status=Job.FAILED, run_after=old),
+                                   Job(task="process_photo", status=Job.DONE)])
+        self.assertEqual(prune_jobs(batch_size=2), 3)
+        self.assertEqual(sorted(Job.objects.values_list("status", flat=True)), [Job.DONE, Job.FAILED])
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+class AccountDeletionTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.other_user = User.objects.create_user(username="OtherUser", password="otheruserotheruser")
+        self.own_photos = [Photo.objects.create(path="image.jpg", description=f"Mine {i}", owner=self.test_user)
+                           for i in range(3)]
+        self.other_photo = Photo.objects.create(path="other.jpg", description="Theirs", owner=self.other_user)
+        for i in range(3):
+            self.comment(self.test_user, self.other_photo, active=i < 2)
+            self.comment(self.other_user, self.own_photos[i])
+        like_photo(self.test_user, self.other_photo.pk)
+        like_photo(self.other_user, self.own_photos[0].pk)
+        Photo.objects.recount()
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def comment(self, author, photo, active=True):
+        Comment.objects.create(content="Comment", photo=photo, author=author, active=active)
+
+    def test_DeleteAccountView_deactivates_and_queues_purge(self):
+        response = self.c.post(reverse("delete_account"))
+        self.assertRedirects(response, reverse("view_photos"))
+        self.test_user.refresh_from_db()
+        self.assertFalse(self.test_user.is_active)
+        self.assertEqual(Photo.objects.filter(owner=self.test_user).count(), 3)
+
+        deletion = AccountDeletion.objects.get()
+        self.assertEqual((deletion.username, deletion.finished_at), ("TestUser", None))
+        job = Job.objects.get(task="purge_account")
+        self.assertEqual(job.arguments, {"deletion_id": deletion.pk})
+        self.assertEqual(self.c.get(reverse("my_photos")).status_code, 302)
+        self.assertFalse(self.c.login(username="TestUser", password="testusertestuser"))
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_content_is_hidden_while_the_purge_is_pending(self):
+        rebuild_index()
+        follow(self.other_user, self.test_user)
+        fan_out_photo(self.other_photo.pk)
+        with override_settings(JOBS_RUN_INLINE=False):
+            delete_account(self.test_user)
+        c = Client()
+        c.login(username="OtherUser", password="otheruserotheruser")
+
+        for route in ("view_photos", "hot_photos", "home_feed"):
+            self.assertEqual(list(c.get(reverse(route)).context["photos"]), [self.other_photo], route)
+        self.assertEqual(list(c.get(reverse("search"), {"q": "Mine"}).context["photos"]), [])
+        self.assertEqual(c.get(reverse("one_photo", args=(self.own_photos[0].pk,))).status_code, 404)
+        comments = c.get(reverse("one_photo", args=(self.other_photo.pk,))).context["comments"]
+        self.assertEqual(list(comments.object_list), [])
+
+    @override_settings(TIMELINE_BATCH_SIZE=2)
+    def test_purge_deletes_content_in_batches_and_keeps_counters(self):
+        follow(self.other_user, self.test_user)
+        follow(self.test_user, self.other_user)
+        for photo in self.own_photos + [self.other_photo]:
+            fan_out_photo(photo.pk)
+        deletion = delete_account(self.test_user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(purge_account(deletion, batch_size=2))
+        comment_deletes = [query for query in queries if query["sql"].startswith('DELETE FROM "album_photo_comment"')]
+        # 3 own comments in batches of 2, then those on the 3 own photos, a batch of 2 photos at a time
+        self.assertEqual(len(comment_deletes), 4)
+        timeline_deletes = [query["sql"] for query in queries
+                            if query["sql"].startswith('DELETE FROM "album_photo_timelineentry"')]
+        # 6 entries of the own photos, then 1 left in the own timeline, 2 at a time; the cascade finds none left
+        self.assertEqual(len([sql for sql in timeline_deletes if '"id" IN' in sql]), 4)
+        self.assertFalse(TimelineEntry.objects.exclude(user=self.other_user).exists())
+        self.assertEqual(list(TimelineEntry.objects.values_list("photo", flat=True)), [self.other_photo.pk])
+        self.assertFalse(Follow.objects.exists())
+
+        self.assertFalse(User.objects.filter(username="TestUser").exists())
+        self.assertEqual(list(Photo.objects.all()), [self.other_photo])
+        self.assertEqual(Comment.objects.count(), 0)
+        self.other_photo.refresh_from_db()
+        self.assertEqual((self.other_photo.like_count, self.other_photo.comment_count), (0, 0))
+        deletion.refresh_from_db()
+        self.assertIsNotNone(deletion.finished_at)
+        self.assertEqual((deletion.user, deletion.photos_deleted, deletion.comments_deleted, deletion.likes_deleted),
+                         (None, 3, 3, 1))
+
+    def test_purge_queues_one_reindex_per_photo_and_batch(self):
+        for _ in range(5):
+            self.comment(self.test_user, self.other_photo)
+        deletion = delete_account(self.test_user)
+        Job.objects.all().delete()
+        purge_account(deletion, batch_size=10)
+        reindexed = Job.objects.filter(task="reindex_photo").values_list("arguments", flat=True)
+        self.assertEqual(list(reindexed), [{"photo_id": self.other_photo.pk}])
+
+    def test_purged_likes_are_taken_off_the_hot_score(self):
+        liked = Photo.objects.create(path="liked.jpg", description="Liked", owner=self.other_user)
+        like_photo(self.other_user, liked.pk)
+        like_photo(self.test_user, liked.pk)
+        purge_account(delete_account(self.test_user))
+        liked.refresh_from_db()
+        self.assertEqual(liked.like_count, 1)
+        self.assertAlmostEqual(liked.hot_score, 1, delta=0.01)
+
+    @override_settings(ACCOUNT_PURGE_JOB_SECONDS=0)
+    def test_purge_job_out_of_time_queues_its_continuation(self):
+        deletion = delete_account(self.test_user)
+        self.assertEqual(execute_job(claim_jobs(10)[0]), Job.DONE)
+        self.assertEqual(Job.objects.filter(task="purge_account", status=Job.PENDING).count(), 1)
+        self.assertTrue(User.objects.filter(pk=self.test_user.pk).exists())
+
+        with override_settings(ACCOUNT_PURGE_JOB_SECONDS=60):
+            self.assertEqual(execute_job(claim_jobs(10)[0]), Job.DONE)
+        deletion.refresh_from_db()
+        self.assertIsNotNone(deletion.finished_at)
+        self.assertFalse(User.objects.filter(pk=self.test_user.pk).exists())
+
+
+class FlakyReplicaView(ReplicaReadMixin, View):
+    def get(self, request):
+        if request.database_replica is not None:
+            raise OperationalError("replica went away")
+        return HttpResponse("read from the primary")
+
+
+# the test database stands in for a replica of itself
+@override_settings(DATABASE_REPLICAS=["default"])
+class ReplicaRoutingTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.p = Photo.objects.create(path="image.jpg", description="Photo", owner=self.test_user)
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+        self.c.cookies.pop(STICKY_COOKIE, None)
+        replicas._down_until.clear()
+
+    def test_router_reads_from_the_replica_until_the_request_writes(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Photo), "default")
+        with replica_state() as state:
+            state.alias = "replica"
+            self.assertEqual(router.db_for_read(Photo), "replica")
+            self.assertEqual(router.db_for_write(Photo), "default")
+            self.assertEqual(router.db_for_read(Photo), "default")
+
+    def test_reads_go_to_the_replica_until_a_write_makes_the_client_sticky(self):
+        for url in (reverse("view_photos"), reverse("my_photos"), reverse("one_photo", args=(self.p.pk,))):
+            response = self.c.get(url)
+            self.assertEqual(response.wsgi_request.database_replica, "default")
+            self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        response = self.c.get(reverse("like", args=(self.p.pk,)))
+        self.assertEqual(response.cookies[STICKY_COOKIE]["max-age"], 10)
+        response = self.c.get(reverse("view_photos"))
+        self.assertIsNone(response.wsgi_request.database_replica)
+        self.assertEqual(list(response.context["liked_photo_ids"]), [self.p.pk])
+
+    def test_replica_down_falls_back_to_the_primary(self):
+        mark_down("default")
+        self.assertIsNone(self.c.get(reverse("view_photos")).wsgi_request.database_replica)
+
+        replicas._down_until.clear()
+        request = RequestFactory().get("/")
+        with replica_state():
+            response = FlakyReplicaView.as_view()(request)
+        self.assertEqual(response.content, b"read from the primary")
+        self.assertIn("default", replicas._down_until)
+
+    def tearDown(self):
+        replicas._down_until.clear()
+
+
+@skipUnless(connection.vendor == "sqlite", "copies the SQLite test database")
+@override_settings(DATABASE_REPLICAS=["replica"])
+class SecondDatabaseReplicaTestClass(TransactionTestCase):
+    """
+    a real second alias, a copy of the database taken before the newest photo was added, so that the photos a page
+    shows tell which database it read from
+    """
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.old = Photo.objects.create(path="image.jpg", description="On both", owner=self.test_user)
+        self.c = Client()
+        self.c.force_login(self.test_user)
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.test_user)
+
+        os.makedirs(TEST_DIR, exist_ok=True)
+        self.replica_path = os.path.join(TEST_DIR, "replica.sqlite3")
+        connection.ensure_connection()
+        with sqlite3.connect(self.replica_path) as replica:
+            connection.connection.backup(replica)
+        connections.databases["replica"] = {"ENGINE": "django.db.backends.sqlite3", "NAME": self.replica_path}
+        self.new = Photo.objects.create(path="image.jpg", description="Not replicated yet", owner=self.test_user)
+        replicas._down_until.clear()
+
+    def test_sync_views_read_from_the_second_database(self):
+        response = self.c.get(reverse("view_photos"))
+        self.assertEqual(response.wsgi_request.database_replica, "replica")
+        self.assertEqual(list(response.context["photos"]), [self.old])
+
+        self.c.get(reverse("like", args=(self.old.pk,)))
+        self.assertEqual(list(self.c.get(reverse("view_photos")).context["photos"]), [self.new, self.old])
+
+    async def test_async_views_read_from_the_second_database(self):
+        with async_views(True):
+            response = await self.async_client.get(reverse("view_photos"))
+            self.assertEqual(response.asgi_request.database_replica, "replica")
+            self.assertEqual(list(response.context["photos"]), [self.old])
+            self.assertEqual((await self.async_client.get(reverse("one_photo", args=(self.new.pk,)))).status_code,
+                             404)
+
+            response = await self.async_client.post(reverse("like_api", args=(self.old.pk,)))
+            self.assertIn(STICKY_COOKIE, response.cookies)
+            response = await self.async_client.get(reverse("view_photos"))
+            self.assertIsNone(response.asgi_request.database_replica)
+            self.assertEqual(list(response.context["photos"]), [self.new, self.old])
+
+    def tearDown(self):
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.databases["replica"]
+        replicas._down_until.clear()
+        shutil.rmtree(TEST_DIR)
+
+
+@override_settings(MEDIA_ROOT=my_media_root)
+class ImportPhotosTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.archive = os.path.join(TEST_DIR, "archive")
+        os.makedirs(os.path.join(self.archive, "2019", "summer"))
+        for number, path in enumerate(["beach_day-1.jpg", "2019/summer/IMG_2.png", "2019/IMG_3.jpg"]):
+            Image.new("RGB", (20, 10), (number * 80, 0, 0)).save(os.path.join(self.archive, path))
+        with open(os.path.join(self.archive, "2019", "IMG_3.jpg.txt"), "w") as sidecar:
+            sidecar.write("Sunset over the lake\n")
+        with open(os.path.join(self.archive, "broken.jpg"), "wb") as broken:
+            broken.write(b"not an image")
+
+    def import_photos(self):
+        output = StringIO()
+        call_command("import_photos", self.archive, owner="TestUser", processes=1, batch_size=2, stdout=output,
+                     stderr=StringIO())
+        return output.getvalue()
+
+    def test_import_stores_photos_with_descriptions_and_queues_processing(self):
+        output = self.import_photos()
+        self.assertIn("Imported 3, duplicates 0, failed 1, already done 0", output)
+        self.assertEqual(sorted(Photo.objects.values_list("description", flat=True)),
+                         ["IMG 2", "Sunset over the lake", "beach day 1"])
+        for photo in Photo.objects.all():
+            self.assertEqual(photo.owner, self.test_user)
+            self.assertEqual(photo.processing_status, Photo.PROCESSING_PENDING)
+            self.assertTrue(photo.path.storage.exists(photo.path.name))
+        for task_name in ("process_photo", "reindex_photo"):
+            self.assertEqual(sorted(Job.objects.filter(task=task_name).values_list("arguments__photo_id", flat=True)),
+                             sorted(Photo.objects.values_list("pk", flat=True)))
+
+    def test_rerun_resumes_from_checkpoint_and_skips_imported_content(self):
+        self.import_photos()
+        self.assertIn("Imported 0, duplicates 0, failed 1, already done 3", self.import_photos())
+        os.remove(os.path.join(self.archive, ".import_photos.checkpoint"))
+        self.assertIn("Imported 0, duplicates 3", self.import_photos())
+        self.assertEqual(Photo.objects.count(), 3)
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+@override_settings(MEDIA_ROOT=my_media_root)
+class ExportPhotosTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.other_user = User.objects.create_user(username="OtherUser", password="otheruserotheruser")
+        with open("photoalbum/tests_data/test_image.jpeg", "rb") as test_photo:
+            self.content = test_photo.read()
+        self.p = Photo.objects.create(path=SimpleUploadedFile("image.jpg", self.content),
+                                      description="Exported photo", owner=self.test_user)
+        Photo.objects.create(path=SimpleUploadedFile("other.jpg", b"other"), description="Not mine",
+                             owner=self.other_user)
+        like_photo(self.other_user, self.p.pk)
+        Comment.objects.create(content="Nice one.", photo=self.p, author=self.other_user)
+        Comment.objects.create(content="Hidden.", photo=self.p, author=self.other_user, active=False)
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def export(self):
+        response = self.c.get(reverse("export_photos"))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertIn("attachment; filename=\"photos-TestUser-", response["Content-Disposition"])
+        return zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+
+    def test_export_streams_originals_and_manifest(self):
+        archive = self.export()
+        self.assertEqual(archive.namelist(), [f"photos/{self.p.pk}.jpg", "manifest.json"])
+        self.assertEqual(archive.read(f"photos/{self.p.pk}.jpg"), self.content)
+        self.assertEqual(archive.getinfo(f"photos/{self.p.pk}.jpg").compress_type, zipfile.ZIP_STORED)
+
+        manifest = json.loads(archive.read("manifest.json"))
+        self.assertEqual(manifest["owner"], "TestUser")
+        [photo] = manifest["photos"]
+        self.assertEqual((photo["file"], photo["description"], photo["like_count"], photo["liked_by"]),
+                         (f"photos/{self.p.pk}.jpg", "Exported photo", 1, ["OtherUser"]))
+        self.assertEqual([comment["content"] for comment in photo["comments"]], ["Nice one."])
+
+    async def test_export_under_asgi(self):
+        # Django 3.1 iterates a streaming response on the event loop under ASGI, where no query may run
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.test_user)
+        response = await client.get(reverse("export_photos"))
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), [f"photos/{self.p.pk}.jpg", "manifest.json"])
+        self.assertEqual(json.loads(archive.read("manifest.json"))["photos"][0]["liked_by"], ["OtherUser"])
+
+    def test_missing_file_is_listed_without_file(self):
+        self.p.path.storage.delete(self.p.path.name)
+        archive = self.export()
+        self.assertEqual(archive.namelist(), ["manifest.json"])
+        self.assertIsNone(json.loads(archive.read("manifest.json"))["photos"][0]["file"])
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+@override_settings(JOBS_RUN_INLINE=True)
+class SearchTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+        self.lake = self.add_photo("Sunset over the lake")
+        self.mountains = self.add_photo("Mountains in winter")
+        self.city = self.add_photo("City lights")
+
+    def add_photo(self, description):
+        photo = Photo.objects.create(path="image.jpg", description=description, owner=self.test_user)
+        enqueue("reindex_photo", photo_id=photo.pk)
+        return photo
+
+    def search(self, query, **params):
+        response = self.c.get(reverse("search"), {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_search_matches_stemmed_words_of_descriptions(self):
+        self.assertEqual(list(self.search("sunsets").context["photos"]), [self.lake])
+        self.assertEqual(list(self.search("").context["photos"]), [])
+
+    def test_descriptions_rank_above_comments_and_index_follows_writes(self):
+        self.c.post(reverse("one_photo", args=(self.city.pk,)), {"content": "Reminds me of a lake"})
+        self.assertEqual(list(self.search("lake").context["photos"]), [self.lake, self.city])
+
+        self.c.post(reverse("edit_photo", args=(self.lake.pk,)), {"description": "Morning fog"})
+        self.assertEqual(list(self.search("lake").context["photos"]), [self.city])
+        Comment.objects.get().delete()
+        self.assertEqual(list(self.search("lake").context["photos"]), [])
+
+    def test_results_are_cursor_paginated(self):
+        for i in range(3):
+            self.add_photo(f"Another lake {i}")
+        page = search_photos("lake", per_page=2)
+        rest = search_photos("lake", after=page.next_cursor, per_page=2)
+        self.assertEqual(len(page) + len(rest), 4)
+        self.assertFalse(set(page.object_list) & set(rest.object_list))
+        self.assertIsNone(rest.next_cursor)
+        response = self.search("lake", after=page.next_cursor)
+        self.assertEqual(list(response.context["photos"]), rest.object_list)
+        self.assertEqual(self.c.get(reverse("search"), {"q": "lake", "after": "broken"}).status_code, 404)
+
+    def test_operators_in_query_are_taken_literally(self):
+        self.assertEqual(list(self.search('lake" OR "city').context["photos"]), [])
+        self.assertEqual(list(self.search("lights*").context["photos"]), [self.city])
+
+    def test_deleted_photo_leaves_index(self):
+        self.lake.delete()
+        self.assertEqual(list(self.search("lake").context["photos"]), [])
+        self.assertEqual(rebuild_index(), 2)
+        self.assertEqual(list(self.search("winter").context["photos"]), [self.mountains])
+
+
+def gradient_image(size, image_format, reverse=False):
+    # brightening left to right, or right to left
+    image = Image.linear_gradient("L").rotate(270 if reverse else 90).resize(size).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=my_media_root, PHOTO_SIMILARITY_MAX_DISTANCE=6)
+class SimilarPhotosTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+        # rows of earlier tests were rolled back, the index of this process must not remember them
+        photo_index.clear()
+
+    def upload(self, content, name):
+        image = SimpleUploadedFile(name, content=content, content_type="image/jpeg")
+        return self.c.post(reverse("add_photo"), {"path": image, "description": name}, follow=True)
+
+    def test_bk_tree_finds_the_same_hashes_as_a_linear_scan(self):
+        rng = random.Random(7)
+        hashes = [rng.getrandbits(64) for _ in range(300)]
+        # near-duplicates of some of them, a few bits apart
+        hashes += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in hashes[:50]]
+        tree = BKTree()
+        for item, value in enumerate(hashes):
+            tree.add(value, item)
+        tree.discard(hashes[0], 0)
+
+        for query in hashes[:60]:
+            expected = sorted((distance(query, value), item) for item, value in enumerate(hashes)
+                              if item != 0 and distance(query, value) <= 6)
+            self.assertEqual(tree.search(query, 6), expected)
+
+    def test_dhash_survives_resizing_and_recompression(self):
+        original = dhash(BytesIO(gradient_image((400, 300), "PNG")))
+        self.assertLessEqual(distance(original, dhash(BytesIO(gradient_image((120, 90), "JPEG")))), 2)
+        self.assertGreater(distance(original, dhash(BytesIO(gradient_image((400, 300), "PNG", reverse=True)))), 20)
+
+    def test_upload_of_a_copy_warns_and_similar_photos_lists_it(self):
+        response = self.upload(gradient_image((400, 300), "JPEG"), "original.jpg")
+        self.assertNotIn("looks like", response.content.decode())
+        self.upload(gradient_image((400, 300), "JPEG", reverse=True), "other.jpg")
+        response = self.upload(gradient_image((200, 150), "JPEG"), "copy.jpg")
+        self.assertIn("looks like one you uploaded before", response.content.decode())
+
+        original, other, copy = Photo.objects.order_by("pk")
+        response = self.c.get(reverse("similar_photos", args=(copy.pk,)))
+        self.assertEqual(response.context["photos"], [original])
+        original.delete()
+        self.assertEqual(self.c.get(reverse("similar_photos", args=(copy.pk,))).context["photos"], [])
+        self.assertEqual(self.c.get(reverse("similar_photos", args=(0,))).status_code, 404)
+
+    def test_similar_photos_of_an_unhashed_photo_is_empty(self):
+        self.upload(gradient_image((400, 300), "JPEG"), "original.jpg")
+        photo = Photo.objects.create(path=SimpleUploadedFile("old.jpg", b"old"), description="Old",
+                                     owner=self.test_user)
+        response = self.c.get(reverse("similar_photos", args=(photo.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["photos"], [])
+
+    def test_upload_that_cannot_be_hashed_is_stored_without_a_warning(self):
+        with patch("album_photo.views.dhash", side_effect=OSError("Truncated image")):
+            response = self.upload(gradient_image((400, 300), "JPEG"), "truncated.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("looks like", response.content.decode())
+        self.assertIsNone(Photo.objects.get().dhash)
+
+    def test_warm_up_builds_the_index(self):
+        self.upload(gradient_image((400, 300), "JPEG"), "original.jpg")
+        photo_index.clear()
+        warm_up()
+        photo = Photo.objects.get()
+        self.assertEqual(photo_index.tree.search(from_db(photo.dhash), 0), [(0, photo.pk)])
+
+    def test_hash_photos_command_backfills_older_photos(self):
+        photo = Photo.objects.create(path=SimpleUploadedFile("old.png", gradient_image((40, 30), "PNG", reverse=True)),
+                                     description="Old", owner=self.test_user)
+        call_command("hash_photos", stdout=StringIO())
+        photo.refresh_from_db()
+        self.assertEqual(photo.dhash, to_db(dhash(BytesIO(gradient_image((40, 30), "PNG", reverse=True)))))
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+@override_settings(MEDIA_ROOT=my_media_root)
+class OrphanedMediaTestClass(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.photo = Photo.objects.create(path=SimpleUploadedFile("kept.jpg", b"kept"), description="Kept",
+                                          owner=self.test_user)
+        self.rendition = f"renditions/{self.photo.pk}/grid-abc.jpg"
+        Photo.objects.filter(pk=self.photo.pk).update(renditions={"grid": self.rendition, "detail": None})
+        self.orphans = ["blobs/00/00/orphan.jpg", f"renditions/{self.photo.pk + 1}/grid-def.jpg",
+                        f"renditions/{self.photo.pk}/grid-old.jpg"]
+        for name in [self.rendition, "blobs/tmp/upload-in-progress"] + self.orphans:
+            self.write(name)
+        old = time.time() - 2 * 24 * 60 * 60
+        for name in [self.photo.path.name, self.rendition] + self.orphans:
+            os.utime(os.path.join(my_media_root, name), (old, old))
+
+    def write(self, name):
+        os.makedirs(os.path.dirname(os.path.join(my_media_root, name)), exist_ok=True)
+        with open(os.path.join(my_media_root, name), "wb") as media_file:
+            media_file.write(b"x" * 1000)
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(my_media_root, name))
+
+    def collect(self, **options):
+        output = StringIO()
+        call_command("delete_orphaned_media", rate=0, batch_size=2, stdout=output, **options)
+        return output.getvalue()
+
+    def test_dry_run_reports_orphans_and_deletes_nothing(self):
+        self.assertIn("Found 3 orphaned files, 2.9\xa0KB reclaimable", self.collect(dry_run=True))
+        self.assertTrue(all(self.exists(name) for name in self.orphans))
+
+    def test_deletes_orphans_but_not_referenced_or_recent_files(self):
+        self.assertIn("Deleted 3 of 3 orphaned files", self.collect())
+        self.assertFalse(any(self.exists(name) for name in self.orphans))
+        self.assertFalse(self.exists(f"renditions/{self.photo.pk + 1}"))
+        for name in [self.photo.path.name, self.rendition, "blobs/tmp/upload-in-progress"]:
+            self.assertTrue(self.exists(name))
+
+    def test_blob_stored_again_is_not_deleted(self):
+        orphan = Photo.objects.create(path=SimpleUploadedFile("again.jpg", b"again"), description="Again",
+                                      owner=self.test_user)
+        name = orphan.path.name
+        Photo.objects.filter(pk=orphan.pk).delete()
+        os.utime(os.path.join(my_media_root, name), (0, 0))
+        Photo.objects.create(path=SimpleUploadedFile("again.jpg", b"again"), description="Again",
+                             owner=self.test_user)
+        Photo.objects.filter(path=name).delete()
+        self.collect()
+        self.assertTrue(self.exists(name))
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+@override_settings(MEDIA_ROOT=my_media_root)
+class MediaViewTestClass(TestCase):
+    def setUp(self):
+        os.makedirs(os.path.join(my_media_root, "blobs"), exist_ok=True)
+        with open(os.path.join(my_media_root, "blobs", "file.jpg"), "wb") as media_file:
+            media_file.write(bytes(range(100)))
+        self.url = reverse("media", args=("blobs/file.jpg",))
+        self.c = Client()
+
+    def test_serves_file_with_validators_and_immutable_caching(self):
+        response = self.c.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(100)))
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertIn("Last-Modified", response)
+
+    def test_answers_conditional_requests_with_304(self):
+        response = self.c.get(self.url)
+        self.assertEqual(self.c.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.c.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+    def test_serves_byte_ranges(self):
+        response = self.c.get(self.url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+
+        response = self.c.get(self.url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(95, 100)))
+        self.assertEqual(self.c.get(self.url, HTTP_RANGE="bytes=200-").status_code, 416)
+
+    def test_ignores_range_when_if_range_does_not_match(self):
+        response = self.c.get(self.url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(MEDIA_ACCEL="x-accel-redirect")
+    def test_hands_transfer_over_to_nginx(self):
+        response = self.c.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/blobs/file.jpg")
+        self.assertEqual(response.content, b"")
+
+    @override_settings(MEDIA_ACCEL="x-accel-redirect")
+    def test_quotes_the_name_handed_over_to_nginx(self):
+        with open(os.path.join(my_media_root, "blobs", "my file?%.jpg"), "wb") as media_file:
+            media_file.write(b"data")
+        response = self.c.get(reverse("media", args=("blobs/my file?%.jpg",)))
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/blobs/my%20file%3F%25.jpg")
+
+    def test_does_not_serve_uploads_in_progress(self):
+        os.makedirs(os.path.join(my_media_root, "blobs", "tmp"), exist_ok=True)
+        with open(os.path.join(my_media_root, "blobs", "tmp", "tmpupload"), "wb") as media_file:
+            media_file.write(b"partial")
+        self.assertEqual(self.c.get(reverse("media", args=("blobs/tmp/tmpupload",))).status_code, 404)
+        self.assertEqual(self.c.get(reverse("media", args=("blobs/x/../tmp/tmpupload",))).status_code, 404)
+
+    def test_does_not_serve_files_outside_media_root(self):
+        self.assertEqual(self.c.get("/media/../../manage.py").status_code, 404)
+        self.assertEqual(self.c.get(reverse("media", args=("blobs",))).status_code, 404)
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+class PhotoCardCacheTestClass(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                 email="testuser@example.com")
+        cls.p = Photo.objects.create(path="image.jpg", description="This is description of test image",
+                                     owner=cls.test_user)
+
+    def setUp(self):
+        caches["photo_cards"].clear()
+        reset_cache_stats()
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def stats(self):
+        return cache_stats()["photo-cards"]
+
+    def test_feed_card_is_rendered_once_per_version(self):
+        self.c.get(reverse("view_photos"))
+        self.c.get(reverse("view_photos"))
+        self.assertEqual(self.stats(), {"hits": 1, "misses": 1})
+
+    def test_like_comment_and_edit_bump_version(self):
+        self.c.get(reverse("like", args=(self.p.pk,)), HTTP_REFERER="/")
+        self.c.post(reverse("one_photo", args=(self.p.pk,)), {"content": "Comment"})
+        self.c.post(reverse("edit_photo", args=(self.p.pk,)), {"description": "New description"})
+        self.c.get(reverse("unlike", args=(self.p.pk,)), HTTP_REFERER="/")
+        self.p.refresh_from_db()
+        self.assertEqual(self.p.version, 5)
+
+    def test_like_button_is_rendered_outside_cached_card(self):
+        self.c.get(reverse("view_photos"))
+        like_photo(self.test_user, self.p.pk)
+        Photo.objects.filter(pk=self.p.pk).update(version=1)
+        response = self.c.get(reverse("view_photos"))
+        self.assertEqual(self.stats(), {"hits": 1, "misses": 1})
+        self.assertContains(response, '<span data-like-count="%s">0</span>' % self.p.pk)
+        self.assertContains(response, "Unlike it")
+
+
+class CommentsPaginationTestClass(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                 email="testuser@example.com")
+        cls.p = Photo.objects.create(path="image.jpg", description="This is description of test image",
+                                     owner=cls.test_user)
+        Comment.objects.bulk_create(Comment(content=f"Comment number {i}.", photo=cls.p, author=cls.test_user)
+                                    for i in range(25))
+        Comment.objects.create(content="Hidden comment.", photo=cls.p, author=cls.test_user, active=False)
+
+    def setUp(self):
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def test_OnePhoto_shows_first_page_of_active_comments_newest_first(self):
+        response = self.c.get(reverse("one_photo", args=(self.p.pk,)))
+        comments = list(response.context["comments"])
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].content, "Comment number 24.")
+        self.assertNotContains(response, "Hidden comment.")
+        self.assertContains(response, "Load more comments")
+
+    def test_photo_comments_returns_following_pages(self):
+        first = self.c.get(reverse("one_photo", args=(self.p.pk,))).context["comments"]
+        response = self.c.get(reverse("photo_comments", args=(self.p.pk,)), {"after": first.next_cursor})
+        data = response.json()
+        self.assertIsNone(data["next"])
+        self.assertEqual(data["html"].count("Comment number"), 5)
+        self.assertIn("Comment number 0.", data["html"])
+
+    def test_comment_authors_are_loaded_with_comments(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.c.get(reverse("photo_comments", args=(self.p.pk,)))
+        self.assertEqual(len([query for query in queries if "auth_user" in query["sql"]]), 2)
+
+
+@override_settings(MEDIA_ROOT=my_media_root)
+class BenchmarkTestClass(TestCase):
+    def test_benchmark_seeds_volumes_and_covers_every_route(self):
+        seed(users=3, photos=5, likes=6, comments=7, rng=random.Random(0))
+        self.assertEqual((User.objects.count(), Photo.objects.count(), Comment.objects.count()), (3, 5, 7))
+        self.assertEqual(sum(Photo.objects.values_list("like_count", flat=True)), 6)
+
+        results = run_benchmark(requests=2)
+        self.assertEqual(uncovered_routes(results), [])
+        for result in results:
+            self.assertTrue(all(status < 400 for status in result["status"]), result)
+            self.assertGreaterEqual(result["p95_ms"], result["p50_ms"])
+
+
+@override_settings(MEDIA_ROOT=my_media_root)
+class ThroughputBenchmarkTestClass(TransactionTestCase):
+    def test_throughput_is_measured_for_every_mode(self):
+        seed(users=3, photos=5, likes=6, comments=7, rng=random.Random(0))
+        results = run_throughput(requests=2, concurrency=1)
+        self.assertEqual({result["mode"] for result in results}, {"wsgi", "asgi", "asgi + async views"})
+        self.assertEqual(len(results), 12)
+        for result in results:
+            self.assertEqual(result["status"], [200], result)
+            self.assertGreater(result["requests_per_s"], 0)
+            self.assertGreaterEqual(result["connections_per_request"], 0)
+
+    def test_async_views_warn_about_connections_per_query(self):
+        self.assertEqual(async_views_connections(None), [])
+        with override_settings(ASYNC_VIEWS=True):
+            self.assertEqual([warning.id for warning in async_views_connections(None)], ["album_photo.W001"])
+            with patch.dict(connection.settings_dict, CONN_MAX_AGE=60):
+                self.assertEqual(async_views_connections(None), [])
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TEST_DIR)
+        except OSError:
+            pass
+
+
+class ServerTimingTestClass(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                 email="testuser@example.com")
+
+    def setUp(self):
+        self.c = Client()
+        self.c.login(username="TestUser", password="testusertestuser")
+
+    def test_response_reports_database_template_and_total_time(self):
+        response = self.c.get(reverse("view_photos"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timing, r"tpl;dur=[\d.]+")
+        self.assertRegex(timing, r"total;dur=[\d.]+")
+        self.assertNotRegex(timing, r"tpl;dur=0\.0,")
+
+    def test_template_timing_does_not_patch_django(self):
+        from django.template.backends.django import Template
+
+        self.c.get(reverse("view_photos"))
+        self.assertEqual(Template.render.__module__, "django.template.backends.django")
+
+    @override_settings(REQUEST_TIMING={"ENABLED": True, "SLOW_REQUEST_MS": 0, "MAX_QUERIES": 50,
+                                       "LOGGED_QUERIES": 2})
+    def test_slow_requests_are_logged_with_slowest_queries(self):
+        with self.assertLogs("album_photo.middleware", "WARNING") as logs:
+            self.c.get(reverse("view_photos"))
+        self.assertIn("Slow request GET /", logs.output[0])
+        self.assertEqual(logs.output[0].count(" ms: SELECT"), 2)
+
+    @override_settings(REQUEST_TIMING={"ENABLED": False})
+    def test_disabled_middleware_is_not_used(self):
+        self.assertNotIn("Server-Timing", self.c.get(reverse("view_photos")))
+
+
+class AsyncViewsTestClass(TransactionTestCase):
+    """async views query from several threads, so the data must be committed for them to see it"""
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="TestUser", password="testusertestuser",
+                                                  email="testuser@example.com")
+        self.p = Photo.objects.create(path="image.jpg", description="This is description of test image",
+                                      owner=self.test_user)
+        Comment.objects.create(content="First comment.", photo=self.p, author=self.test_user)
+        like_photo(self.test_user, self.p.pk)
+        self.c = AsyncClient()
+        self.c.force_login(self.test_user)
+        self.anonymous = AsyncClient()
+        self.async_views = async_views(True)
+        self.async_views.__enter__()
+
+    def tearDown(self):
+        self.async_views.__exit__(None, None, None)
+
+    async def test_feed_lists_photos_with_like_state(self):
+        response = await self.c.get(reverse("view_photos"))
+        self.assertEqual(list(response.context["photos"]), [self.p])
+        self.assertEqual(response.context["liked_photo_ids"], {self.p.pk})
+        self.assertContains(response, "Unlike it")
+        self.assertEqual((await self.c.get(reverse("view_photos") + "?page=2")).status_code, 404)
+
+    async def test_feed_rejects_the_same_page_numbers_as_the_sync_view(self):
+        def sync_status(query):
+            request = RequestFactory().get(reverse("view_photos"), query)
+            request.user = self.test_user
+            try:
+                return ViewPhotos.as_view()(request).status_code
+            except Http404:
+                return 404
+
+        for page in ["0", "-1", "2", "x", "1", "last"]:
+            with self.subTest(page=page):
+                # the Django 3.1 AsyncClient drops the data of a GET, the query goes in the path
+                response = await self.c.get(f"{reverse('view_photos')}?page={page}")
+                self.assertEqual(response.status_code, await sync_to_async(sync_status)({"page": page}))
+
+    @override_settings(PHOTO_FEED_CURSOR_PAGINATION=True)
+    async def test_feed_with_cursor_pagination(self):
+        response = await self.anonymous.get(reverse("view_photos"))
+        self.assertEqual(list(response.context["photos"]), [self.p])
+        self.assertEqual(response.context["liked_photo_ids"], frozenset())
+
+    async def test_one_photo_shows_photo_comments_and_like_state(self):
+        response = await self.c.get(reverse("one_photo", args=(self.p.pk,)))
+        self.assertEqual(response.context["photo"], self.p)
+        self.assertEqual([comment.content for comment in response.context["comments"]], ["First comment."])
+        self.assertEqual(response.context["liked_photo_ids"], {self.p.pk})
+        self.assertIn('db;dur=', response["Server-Timing"])
+        self.assertEqual((await self.c.get(reverse("one_photo", args=(self.p.pk + 1,)))).status_code, 404)
+
+    async def test_one_photo_requires_login(self):
+        response = await self.anonymous.get(reverse("one_photo", args=(self.p.pk,)))
+        self.assertRedirects(response, f"/login/?next=/photo/{self.p.pk}/", fetch_redirect_response=False)
+
+    async def test_comments_are_posted_through_sync_view(self):
+        # the Django 3.1 AsyncClient cannot send multipart bodies
+        response = await self.c.post(reverse("one_photo", args=(self.p.pk,)), "content=Second+comment.",
+                                     content_type="application/x-www-form-urlencoded")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], f"/photo/{self.p.pk}/")
+
+    async def test_like_api_returns_counts(self):
+        response = await self.c.post(reverse("unlike_api", args=(self.p.pk,)))
+        self.assertEqual(response.json(), {"liked": False, "like_count": 0})
+        response = await self.c.post(reverse("like_api", args=(self.p.pk,)))
+        self.assertEqual(response.json(), {"liked": True, "like_count": 1})
+        self.assertEqual((await self.c.post(reverse("like_api", args=(self.p.pk + 1,)))).status_code, 404)
+        self.assertEqual((await self.anonymous.post(reverse("like_api", args=(self.p.pk,)))).status_code, 403)
@@ -0,0 +1,167 @@
+"""
+Home feeds of followed accounts. Each user's feed is read from a timeline table (TimelineEntry) filled by fan-out
+on write: the fan_out_photo job copies a new photo into the timelines of its owner and of the owner's followers,
+a batch of followers at a time. Accounts with TIMELINE_FAN_OUT_LIMIT followers or more are fanned out on read
+instead - their follows are flagged and their photos are merged into the feed straight from the photo table - so
+that one upload does not turn into a million inserts. Following an account backfills the follower's timeline with
+its recent photos and unfollowing trims them again, in batches, by the backfill_timeline and trim_timeline jobs.
+
+A page of the home feed is one query: the newest timeline entries UNION the newest photos of the followed large
+accounts, each a range scan of an index limited to the page size, joined to the photos.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Subquery
+from django.db.models.expressions import RawSQL
+
+from album_photo.jobs import enqueue
+from album_photo.models import Follow, Photo, TimelineEntry
+from album_photo.pagination import CursorPage, CursorPaginator
+
+
+def is_large(user_id):
+    """whether the account has TIMELINE_FAN_OUT_LIMIT followers, without counting past the limit"""
+
+    limit = settings.TIMELINE_FAN_OUT_LIMIT
+    return Follow.objects.filter(followed_id=user_id).order_by().values("pk")[limit - 1:limit].exists()
+
+
+def follows(user, followed_id):
+    return user.is_authenticated and Follow.objects.filter(follower_id=user.pk, followed_id=followed_id).exists()
+
+
+def follows_owner(user, photo_id):
+    """follows() for the owner of a photo that has not been fetched yet"""
+
+    return follows(user, Subquery(Photo.objects.filter(pk=photo_id).values("owner_id")))
+
+
+def follow(follower, followed):
+    """makes `follower` follow `followed`, idempotently, and queues the backfill of their timeline"""
+
+    if follower.pk == followed.pk:
+        raise ValueError("Users cannot follow themselves")
+    with transaction.atomic():
+        large = is_large(followed.pk)
+        try:
+            with transaction.atomic():
+                Follow.objects.create(follower=follower, followed=followed, fan_out_on_read=large)
+        except IntegrityError:
+            return False
+        if not large:
+            enqueue("backfill_timeline", follower_id=follower.pk, followed_id=followed.pk)
+    return True
+
+
+def unfollow(follower, followed):
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower=follower, followed=followed).delete()
+        if deleted:
+            enqueue("trim_timeline", follower_id=follower.pk, followed_id=followed.pk)
+    return bool(deleted)
+
+
+def _insert_entries(user_ids, photo_id, creation_date):
+    # a retried job finds some entries there already
+    TimelineEntry.objects.bulk_create((TimelineEntry(user_id=user_id, photo_id=photo_id, creation_date=creation_date)
+                                       for user_id in user_ids), ignore_conflicts=True)
+
+
+def fan_out_photo(photo_id, batch_size=None):
+    """copies a new photo into the timelines of its owner and their followers, or flags the owner as large"""
+
+    batch_size = batch_size or settings.TIMELINE_BATCH_SIZE
+    photo = Photo.objects.filter(pk=photo_id).values("owner_id", "creation_date").first()
+    if photo is None:
+        return
+    owner_id, creation_date = photo["owner_id"], photo["creation_date"]
+    _insert_entries([owner_id], photo_id, creation_date)
+
+    if is_large(owner_id):
+        follows_to_flag = Follow.objects.filter(followed_id=owner_id, fan_out_on_read=False)
+        while True:
+            ids = list(follows_to_flag.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                return
+            Follow.objects.filter(pk__in=ids).update(fan_out_on_read=True)
+
+    last_pk = 0
+    while True:
+        rows = list(Follow.objects.filter(followed_id=owner_id, fan_out_on_read=False, pk__gt=last_pk)
+                    .order_by("pk").values_list("pk", "follower_id")[:batch_size])
+        if not rows:
+            return
+        _insert_entries([follower_id for _, follower_id in rows], photo_id, creation_date)
+        last_pk = rows[-1][0]
+
+
+def backfill_timeline(follower_id, followed_id, batch_size=None):
+    """adds the newest TIMELINE_BACKFILL_PHOTOS photos of a newly followed account to the follower's timeline"""
+
+    batch_size = batch_size or settings.TIMELINE_BATCH_SIZE
+    photos = (Photo.objects.filter(owner_id=followed_id).order_by("-creation_date", "-id")
+              .values_list("pk", "creation_date")[:settings.TIMELINE_BACKFILL_PHOTOS])
+    for start in range(0, settings.TIMELINE_BACKFILL_PHOTOS, batch_size):
+        if not Follow.objects.filter(follower_id=follower_id, followed_id=followed_id).exists():
+            # unfollowed in the meantime, trim_timeline takes care of what was added
+            return
+        batch = list(photos[start:start + batch_size])
+        TimelineEntry.objects.bulk_create((TimelineEntry(user_id=follower_id, photo_id=photo_id, creation_date=date)
+                                           for photo_id, date in batch), ignore_conflicts=True)
+        if len(batch) < batch_size:
+            return
+
+
+def trim_timeline(follower_id, followed_id, batch_size=None):
+    """removes the photos of an unfollowed account from the follower's timeline, a batch of its photos at a time"""
+
+    batch_size = batch_size or settings.TIMELINE_BATCH_SIZE
+    photo_ids = Photo.objects.filter(owner_id=followed_id).values_list("pk", flat=True).iterator(chunk_size=batch_size)
+    while True:
+        batch = list(islice(photo_ids, batch_size))
+        if not batch:
+            return
+        if Follow.objects.filter(follower_id=follower_id, followed_id=followed_id).exists():
+            # followed again in the meantime
+            return
+        TimelineEntry.objects.filter(user_id=follower_id, photo_id__in=batch).delete()
+
+
+def _older_than(creation_date, photo_id, tie_breaker):
+    # the redundant leading <= lets the database use the (..., creation_date, id) index as a range
+    return Q(creation_date__lte=creation_date) & (Q(creation_date__lt=creation_date)
+                                                  | Q(**{f"{tie_breaker}__lt": photo_id}))
+
+
+def home_feed(user, after=None, per_page=21):
+    """a CursorPage of the photos in the user's timeline and of the large accounts they follow, newest first"""
+
+    paginator = CursorPaginator(Photo.objects.all(), per_page)
+    # entries of accounts being deleted stay until their purge reaches them
+    timeline = TimelineEntry.objects.filter(user_id=user.pk, photo__owner__is_active=True)
+    pulled = Photo.objects.filter(owner__in=Follow.objects.filter(follower_id=user.pk, fan_out_on_read=True,
+                                                                  followed__is_active=True).values("followed"))
+    if after:
+        creation_date, photo_id = paginator.decode_cursor(after)
+        timeline = timeline.filter(_older_than(creation_date, photo_id, "photo_id"))
+        pulled = pulled.filter(_older_than(creation_date, photo_id, "id"))
+
+    timeline_sql, timeline_params = (timeline.order_by("-creation_date", "-photo_id")
+                                     .values_list("photo_id", "creation_date")[:per_page + 1].query.sql_with_params())
+    pulled_sql, pulled_params = (pulled.order_by("-creation_date", "-id")
+                                 .values_list("id", "creation_date")[:per_page + 1].query.sql_with_params())
+    page_ids = RawSQL(f"""
+        SELECT photo_id FROM (
+            SELECT * FROM ({timeline_sql}) timeline
+            UNION
+            SELECT * FROM ({pulled_sql}) pulled
+            ORDER BY 2 DESC, 1 DESC LIMIT %s
+        ) page
+    """, timeline_params + pulled_params + (per_page + 1,))
+
+    rows = list(Photo.objects.select_related("owner").filter(pk__in=page_ids).order_by("-creation_date", "-id"))
+    object_list = rows[:per_page]
+    next_cursor = paginator.encode_cursor(object_list[-1]) if len(rows) > per_page else None
+    return CursorPage(object_list, next_cursor, None)
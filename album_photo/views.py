@@ -1,3 +1,9 @@
+import mimetypes
+import os
+import posixpath
+import stat
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import UserCreationForm
@@ -5,15 +11,38 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
 from django.contrib.auth.views import PasswordChangeView, PasswordChangeDoneView
 from django.contrib.messages.views import SuccessMessageMixin
-from django.core.exceptions import PermissionDenied
-from django.http import HttpResponseRedirect
-from django.shortcuts import render, redirect
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.paginator import InvalidPage
+from django.db import transaction
+from django.db.models import F
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, JsonResponse, \
+    StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.generic import CreateView, ListView, FormView, UpdateView, DeleteView
 from django.views.generic.base import View
 
+from album_photo.accounts import delete_account
+from album_photo.export import zip_album
 from album_photo.forms import AddPhotoForm, EditPhotoForm,  LoginForm, CustomUserChangeForm, CommentCreationForm
+from album_photo.hot import heat
 from album_photo.models import Photo, Comment
+from album_photo.pagination import CursorPaginationMixin, CursorPaginator
+from album_photo.replicas import ReplicaReadMixin
+from album_photo.search import search_photos
+from album_photo.similarity import dhash, similar_photos, to_db
+from album_photo.storage import TEMPORARY_DIRECTORY
+from album_photo.timelines import follow, follows, home_feed, unfollow
+from album_photo.jobs import enqueue
+from album_photo.likes import like_photo, liked_photo_ids, unlike_photo
+from album_photo.media import accel_headers, cache_headers, file_etag, parse_range, read_range
+
+COMMENTS_PER_PAGE = 20
 
 
 # USER functionality
@@ -74,6 +103,8 @@ class EditPersonalInfoView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
 
 
 class DeleteAccountView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
+    """deactivates the account right away; its photos, comments and likes are purged by a background job"""
+
     template_name = 'account_confirm_delete.html'
     model = User
     success_url = reverse_lazy("view_photos")
@@ -82,6 +113,13 @@ class DeleteAccountView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
     def get_object(self):
         return self.request.user
 
+    def delete(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        delete_account(self.object)
+        logout(request)
+        messages.success(request, self.success_message)
+        return HttpResponseRedirect(self.get_success_url())
+
 
 class CustomPasswordChangeView(LoginRequiredMixin, PasswordChangeView):
     template_name = 'password_change.html'
@@ -105,8 +143,21 @@ class AddPhoto(LoginRequiredMixin, View):
         if form.is_valid():
             path = form.cleaned_data["path"]
             description = form.cleaned_data["description"]
-            photo = Photo.objects.create(path=path, owner=request.user, description=description)
+            try:
+                image_hash = to_db(dhash(path))
+            except OSError:
+                # passed the form's check but cannot be decoded in full; it is just left out of similarity lookups
+                image_hash = None
+            path.seek(0)
+            photo = Photo.objects.create(path=path, owner=request.user, description=description,
+                                         processing_status=Photo.PROCESSING_PENDING, dhash=image_hash)
+            Photo.objects.filter(pk=photo.pk).update(**heat(settings.PHOTO_HOT_WEIGHTS["upload"]))
+            enqueue("process_photo", photo_id=photo.pk)
+            enqueue("reindex_photo", photo_id=photo.pk)
+            enqueue("fan_out_photo", photo_id=photo.pk)
             messages.success(request, 'Photo successfully uploaded')
+            if similar_photos(photo, queryset=Photo.objects.filter(owner=request.user), limit=1):
+                messages.warning(request, 'This photo looks like one you uploaded before - see "Similar photos"')
             return redirect(f"/photo/{photo.pk}/")
 
         ctx = {"form": form}
@@ -130,12 +181,12 @@ class EditPhoto(LoginRequiredMixin, SuccessMessageMixin, View):
 
         if form.is_valid():
             new_description = form.cleaned_data["description"]
-            photo.description = new_description
-            photo.save()
+            Photo.objects.filter(pk=photo_id).bump_version(description=new_description)
+            enqueue("reindex_photo", photo_id=photo_id)
             messages.success(request, 'Description changed')
             return redirect(f"/photo/{photo_id}")
 
-        ctx = {"form": form}
+        ctx = {"form": form, "photo": photo}
         return render(request, "edit_photo_tmp.html", ctx)
 
 
@@ -151,42 +202,197 @@ class DeletePhoto(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
         return render(request, "delete_photo_tmp.html")
 
 
+def redirect_back(request, *fallback):
+    """redirects to the page the request came from, or to `fallback` when the referer is missing or foreign"""
+
+    referer = request.META.get('HTTP_REFERER')
+    if referer and url_has_allowed_host_and_scheme(referer, {request.get_host()}, request.is_secure()):
+        return HttpResponseRedirect(referer)
+    return redirect(*fallback)
+
+
 class LikePhoto(LoginRequiredMixin, View):
+    """fallback for browsers without JavaScript, see LikePhotoApi"""
+
     def get(self, request, pk):
-        photo = Photo.objects.get(pk=pk)
-        photo.likes.add(request.user)
-        return HttpResponseRedirect(self.request.META.get('HTTP_REFERER'))
+        like_photo(request.user, pk)
+        return redirect_back(request, "one_photo", pk)
 
 
 class UnlikePhoto(LoginRequiredMixin, View):
+    """fallback for browsers without JavaScript, see UnlikePhotoApi"""
+
     def get(self, request, pk):
-        photo = Photo.objects.get(pk=pk)
-        photo.likes.remove(request.user)
-        return HttpResponseRedirect(self.request.META.get('HTTP_REFERER'))
+        unlike_photo(request.user, pk)
+        return redirect_back(request, "one_photo", pk)
+
+
+class FollowUser(LoginRequiredMixin, View):
+    def post(self, request, pk):
+        followed = User.objects.filter(pk=pk, is_active=True).first()
+        if followed is None or followed == request.user:
+            raise Http404("No such user to follow")
+        follow(request.user, followed)
+        return redirect_back(request, "home_feed")
+
+
+class UnfollowUser(LoginRequiredMixin, View):
+    def post(self, request, pk):
+        followed = User.objects.filter(pk=pk).first()
+        if followed is None:
+            raise Http404("No such user")
+        unfollow(request.user, followed)
+        return redirect_back(request, "home_feed")
+
 
+class LikePhotoApi(LoginRequiredMixin, View):
+    raise_exception = True
 
-class ViewPhotos(ListView):
+    def post(self, request, pk):
+        return JsonResponse({"liked": True, "like_count": like_photo(request.user, pk)})
+
+
+class UnlikePhotoApi(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def post(self, request, pk):
+        return JsonResponse({"liked": False, "like_count": unlike_photo(request.user, pk)})
+
+
+class ViewPhotos(ReplicaReadMixin, CursorPaginationMixin, ListView):
     template_name = "view_photos_tmp.html"
     model = Photo
     context_object_name = 'photos'
     paginate_by = 21
     ordering = "-creation_date"
 
+    def get_cursor_pagination(self):
+        return settings.PHOTO_FEED_CURSOR_PAGINATION
+
+    def get_queryset(self):
+        return super().get_queryset().visible().select_related("owner")
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["liked_photo_ids"] = liked_photo_ids(self.request.user, ctx["photos"])
+        return ctx
+
+
+class HotPhotos(ReplicaReadMixin, CursorPaginationMixin, ListView):
+    """photos with the most like and comment activity lately, walked with ?after= cursors over the hot score index"""
+
+    template_name = "hot_photos_tmp.html"
+    model = Photo
+    context_object_name = "photos"
+    paginate_by = 21
+    cursor_key = "hot_score"
+
+    def get_cursor_pagination(self):
+        return True
+
+    def get_queryset(self):
+        return super().get_queryset().visible().select_related("owner")
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["liked_photo_ids"] = liked_photo_ids(self.request.user, ctx["photos"])
+        return ctx
+
+
+class HomeFeed(ReplicaReadMixin, LoginRequiredMixin, View):
+    """photos of the user and of the accounts they follow, newest first, walked with ?after= cursors"""
+
+    paginate_by = 21
+
+    def get(self, request):
+        try:
+            page = home_feed(request.user, after=request.GET.get("after"), per_page=self.paginate_by)
+        except InvalidPage as error:
+            raise Http404(str(error))
+        ctx = {"photos": page.object_list, "page_obj": page,
+               "liked_photo_ids": liked_photo_ids(request.user, page.object_list)}
+        return render(request, "home_feed_tmp.html", ctx)
+
+
+class SearchPhotos(View):
+    """photos whose description or comments match ?q=, best matches first, walked with ?after= cursors"""
+
+    paginate_by = 21
+
+    def get(self, request):
+        query = request.GET.get("q", "")
+        try:
+            page = search_photos(query, after=request.GET.get("after"), per_page=self.paginate_by)
+        except InvalidPage as error:
+            raise Http404(str(error))
+        ctx = {"query": query, "photos": page.object_list, "page_obj": page,
+               "liked_photo_ids": liked_photo_ids(request.user, page.object_list)}
+        return render(request, "search_tmp.html", ctx)
+
+
+class MyPhotos(ReplicaReadMixin, LoginRequiredMixin, CursorPaginationMixin, ListView):
+    template_name = "my_photos_tmp.html"
+    model = Photo
+    context_object_name = "photos"
+    paginate_by = 21
+    ordering = ("-creation_date", "-id")
+
+    def get_cursor_pagination(self):
+        return settings.PHOTO_FEED_CURSOR_PAGINATION
+
+    def get_queryset(self):
+        # only what the cards show; like and comment counts are the counters kept on the row
+        return (super().get_queryset().filter(owner=self.request.user)
+                .only("path", "renditions", "creation_date", "version", "like_count", "comment_count"))
+
+
+class ExportPhotos(LoginRequiredMixin, View):
+    """
+    streams a ZIP of the user's original photos with a manifest.json of descriptions, dates, likes and comments;
+    the rows are read before the response starts, so it works under ASGI too
+    """
 
-class MyPhotos(LoginRequiredMixin, View):
     def get(self, request):
-        photos = Photo.objects.filter(owner=request.user).order_by("-creation_date")
-        ctx = {"photos": photos}
-        return render(request, "my_photos_tmp.html", ctx)
+        response = StreamingHttpResponse(zip_album(request.user), content_type="application/zip")
+        filename = f"photos-{request.user.username}-{timezone.localdate():%Y-%m-%d}.zip"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
 
 
-class OnePhoto(LoginRequiredMixin, View):
-    """this view displays photo details and a form to add comments"""
+class SimilarPhotos(LoginRequiredMixin, View):
+    """photos that look like the given one (resized, recompressed or lightly edited copies), most alike first"""
+
+    paginate_by = 21
+
+    def get(self, request, photo_id):
+        photo = Photo.objects.filter(pk=photo_id).first()
+        if photo is None:
+            raise Http404("No such photo")
+        matches = similar_photos(photo, queryset=Photo.objects.visible().select_related("owner"),
+                                 limit=self.paginate_by)
+        photos = [similar for _, similar in matches]
+        ctx = {"photo": photo, "photos": photos, "liked_photo_ids": liked_photo_ids(request.user, photos)}
+        return render(request, "similar_photos_tmp.html", ctx)
+
+
+def comment_page(photo_id, after=None):
+    """a page of the photo's active comments, newest first, walked with cursors over the comment index"""
+
+    comments = Comment.objects.filter(photo_id=photo_id, active=True, author__is_active=True).select_related("author")
+    try:
+        return CursorPaginator(comments, COMMENTS_PER_PAGE).page(after=after)
+    except InvalidPage as error:
+        raise Http404(str(error))
+
+
+class OnePhoto(ReplicaReadMixin, LoginRequiredMixin, View):
+    """this view displays photo details, the newest comments and a form to add comments"""
 
     def get(self, request, photo_id):
         form = CommentCreationForm()
-        photo = Photo.objects.get(pk=photo_id)
-        ctx = {"photo": photo, "form": form}
+        photo = get_object_or_404(Photo.objects.visible().select_related("owner"), pk=photo_id)
+        ctx = {"photo": photo, "form": form, "liked_photo_ids": liked_photo_ids(request.user, [photo]),
+               "comments": comment_page(photo_id), "following": follows(request.user, photo.owner_id)}
         return render(request, "view_one_photo_tmp.html", ctx)
 
     def post(self, request, photo_id):
@@ -195,9 +401,77 @@ class OnePhoto(LoginRequiredMixin, View):
 
         if form.is_valid():
             content = form.cleaned_data["content"]
-            Comment.objects.create(content=content, photo=photo, author=request.user)
+            with transaction.atomic():
+                Comment.objects.create(content=content, photo=photo, author=request.user)
+                Photo.objects.filter(pk=photo_id).bump_version(
+                    comment_count=F("comment_count") + 1, **heat(settings.PHOTO_HOT_WEIGHTS["comment"]))
+                enqueue("reindex_photo", photo_id=photo_id)
             messages.success(request, 'Your comment has been saved!')
             return redirect(f'/photo/{photo_id}/')
 
         ctx = {"form": form}
         return render(request, "view_photos_tmp.html", ctx)
+
+
+class PhotoComments(LoginRequiredMixin, View):
+    """next page of a photo's comments for the "Load more" button, as rendered HTML and the following cursor"""
+
+    raise_exception = True
+
+    def get(self, request, photo_id):
+        comments = comment_page(photo_id, after=request.GET.get("after"))
+        html = render_to_string("comments_list.html", {"comments": comments}, request)
+        return JsonResponse({"html": html, "next": comments.next_cursor})
+
+
+# MEDIA
+
+class MediaView(View):
+    """
+    serves uploaded files with ETag/Last-Modified validators, single byte ranges and immutable caching;
+    with MEDIA_ACCEL set, the bytes are sent by the front web server instead of the Python worker
+    """
+
+    def get(self, request, path):
+        name = posixpath.normpath(path).lstrip("/")
+        if name == TEMPORARY_DIRECTORY or name.startswith(TEMPORARY_DIRECTORY + "/"):
+            # partial uploads
+            raise Http404
+        try:
+            full_path = default_storage.path(name)
+            file_stat = os.stat(full_path)
+        except (SuspiciousFileOperation, OSError):
+            raise Http404
+        if not stat.S_ISREG(file_stat.st_mode):
+            raise Http404
+
+        etag = file_etag(file_stat)
+        conditional = get_conditional_response(request, etag=etag, last_modified=int(file_stat.st_mtime))
+        if conditional is not None:
+            if conditional.status_code == 304:
+                cache_headers(conditional, file_stat, etag)
+            return conditional
+
+        content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        if settings.MEDIA_ACCEL:
+            response = HttpResponse(content_type=content_type)
+            return cache_headers(accel_headers(response, name, full_path), file_stat, etag)
+
+        byte_range = None
+        if "HTTP_RANGE" in request.META and request.META.get("HTTP_IF_RANGE", etag) == etag:
+            try:
+                byte_range = parse_range(request.META["HTTP_RANGE"], file_stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{file_stat.st_size}"
+                return response
+
+        if byte_range is None:
+            response = FileResponse(open(full_path, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(full_path, start, end), status=206,
+                                             content_type=content_type)
+            response["Content-Length"] = end - start + 1
+            response["Content-Range"] = f"bytes {start}-{end}/{file_stat.st_size}"
+        return cache_headers(response, file_stat, etag)
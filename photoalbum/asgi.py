@@ -10,7 +10,14 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from django.db import connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'photoalbum.settings')
 
 application = get_asgi_application()
+
+from album_photo.similarity import warm_up  # noqa: E402 - needs the apps loaded by get_asgi_application()
+
+warm_up()
+# the connection opened for it is not to be shared with worker processes forked from this one
+connections.close_all()
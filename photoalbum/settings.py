@@ -58,7 +58,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'album_photo',
+    'album_photo.apps.AlbumPhotoConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -71,6 +71,8 @@ INSTALLED_APPS = [
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
+    'album_photo.middleware.ServerTimingMiddleware',
+    'album_photo.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,11 +82,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Server-Timing header and slow request log, see album_photo/middleware.py
+REQUEST_TIMING = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,  # log requests taking longer
+    'MAX_QUERIES': 50,  # log requests running more SQL queries
+    'LOGGED_QUERIES': 5,  # number of slowest queries included in the log
+}
+
 ROOT_URLCONF = 'photoalbum.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates timing the rendering for the Server-Timing header of album_photo.middleware
+        'BACKEND': 'album_photo.template_backends.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -110,6 +121,37 @@ except ModuleNotFoundError:
     logger.warning("Database not configured in file local_settings.py! \n Fill out this data and try again!")
     exit(0)
 
+# read replicas: every alias of DATABASES besides "default", used by the feed and photo views - see
+# album_photo/replicas.py. After a write, the client keeps reading from the primary for the sticky window; a replica
+# that is down is retried after the retry delay (both in seconds).
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["album_photo.replicas.ReplicaRouter"]
+DATABASE_REPLICA_STICKY_SECONDS = 10
+DATABASE_REPLICA_RETRY_SECONDS = 30
+
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# "photo_cards" keeps rendered photo cards of the feeds; for a cache shared by all worker processes switch it to
+# album_photo.cache.CountingFileBasedCache with a directory as LOCATION (or override CACHES in local_settings.py)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'photo_cards': {
+        'BACKEND': 'album_photo.cache.CountingLocMemCache',
+        'LOCATION': 'photo-cards',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+try:
+    from photoalbum.local_settings import CACHES # noqa
+except ImportError:
+    pass
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -151,6 +193,13 @@ STATIC_URL = '/static/'
 MEDIA_ROOT = 'album_photo/media/'
 MEDIA_URL = '/media/'
 
+# media files never change once written, so browsers may keep them for a year
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+# None - media is streamed by Django; "x-accel-redirect" - by nginx, from an internal location
+# at MEDIA_ACCEL_PREFIX aliasing MEDIA_ROOT; "x-sendfile" - by Apache mod_xsendfile or lighttpd
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
 LOGIN_URL = '/login/'
 LOGOUT_URL = '/logout/'
 
@@ -163,3 +212,50 @@ MESSAGE_TAGS = {
     messages.WARNING: 'alert-warning',
     messages.ERROR: 'alert-danger',
 }
+
+# fixed widths (in pixels) of the downscaled copies generated for every uploaded photo
+PHOTO_RENDITIONS = {
+    "grid": 480,
+    "detail": 1080,
+    "full": 2048,
+}
+# encodings made of every rendition besides JPEG, served through <picture> to browsers that accept them;
+# formats the installed Pillow cannot write are skipped
+PHOTO_RENDITION_FORMATS = ["avif", "webp"]
+
+# serve the feed, the photo detail and the like API with the async views of album_photo/async_views.py;
+# meant for the ASGI entry point (photoalbum/asgi.py), under WSGI they only add an event loop per request
+ASYNC_VIEWS = False
+
+# text search configuration (stemming, stop words) of the PostgreSQL full-text index, see album_photo/search.py
+PHOTO_SEARCH_CONFIG = "english"
+
+# largest number of differing bits (of 64) between the dHashes of two photos for them to count as similar;
+# also the threshold of the duplicate warning on upload, see album_photo/similarity.py
+PHOTO_SIMILARITY_MAX_DISTANCE = 6
+
+# deleted accounts are deactivated at once and purged by the purge_account job (album_photo/accounts.py):
+# rows deleted per transaction, and seconds one job runs before queueing the next to continue
+ACCOUNT_PURGE_BATCH_SIZE = 500
+ACCOUNT_PURGE_JOB_SECONDS = 60
+
+# the hot feed (album_photo/hot.py): weights of the events making a photo popular, and seconds in which their
+# weight halves; `update_hot_scores` should run at least every few hundred half-lives to keep scores in range
+PHOTO_HOT_WEIGHTS = {"upload": 1.0, "like": 1.0, "comment": 2.0}
+PHOTO_HOT_HALF_LIFE = 24 * 60 * 60
+
+# home feeds of followed accounts (album_photo/timelines.py): accounts with this many followers are read on fan-out
+# on read instead of copying their photos into every follower's timeline; rows written or deleted per batch by the
+# timeline jobs; newest photos of an account copied into the timeline of a new follower
+TIMELINE_FAN_OUT_LIMIT = 10000
+TIMELINE_BATCH_SIZE = 1000
+TIMELINE_BACKFILL_PHOTOS = 500
+
+# walk the photo feed with ?after=/?before= cursors instead of LIMIT/OFFSET page numbers
+PHOTO_FEED_CURSOR_PAGINATION = False
+
+# background jobs (see album_photo/jobs.py), run by `python3 manage.py run_jobs`
+JOBS_RUN_INLINE = False  # run jobs in the process that enqueues them, without a worker
+JOBS_RETRY_DELAY = 30  # seconds before the first retry, doubled on every further attempt
+JOBS_LOCK_TIMEOUT = 15 * 60  # seconds after which a job of a crashed worker is picked up again
+JOBS_KEEP_DONE = 24 * 60 * 60  # seconds finished jobs are kept before run_jobs deletes them
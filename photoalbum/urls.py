@@ -13,13 +13,23 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf.urls.static import static
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
+from album_photo.async_views import AsyncViewPhotos, AsyncOnePhoto, AsyncLikePhotoApi, AsyncUnlikePhotoApi
 from album_photo.views import AddPhoto, EditPhoto, DeletePhoto, ViewPhotos, LikePhoto, UnlikePhoto, MyPhotos, \
     LoginView, LogoutView, EditPersonalInfoView, SignUpView, DeleteAccountView, CustomPasswordChangeView, \
-    CustomPasswordChangeDoneView, account_settings, OnePhoto
-from photoalbum.settings import MEDIA_URL, MEDIA_ROOT
+    CustomPasswordChangeDoneView, account_settings, OnePhoto, MediaView, LikePhotoApi, UnlikePhotoApi, \
+    PhotoComments, ExportPhotos, SearchPhotos, SimilarPhotos, HotPhotos, \
+    HomeFeed, FollowUser, UnfollowUser
+from photoalbum.settings import MEDIA_URL
+
+if settings.ASYNC_VIEWS:
+    feed_view, one_photo_view = AsyncViewPhotos.as_view(), AsyncOnePhoto.as_view()
+    like_api_view, unlike_api_view = AsyncLikePhotoApi.as_view(), AsyncUnlikePhotoApi.as_view()
+else:
+    feed_view, one_photo_view = ViewPhotos.as_view(), OnePhoto.as_view()
+    like_api_view, unlike_api_view = LikePhotoApi.as_view(), UnlikePhotoApi.as_view()
 
 urlpatterns = [
     path('manager/', admin.site.urls),
@@ -36,7 +46,18 @@ urlpatterns = [
     path("photo/delete/<int:pk>/", DeletePhoto.as_view(), name="delete_photo"),
     path('photo/like/<int:pk>/', LikePhoto.as_view(), name='like'),
     path('photo/unlike/<int:pk>/', UnlikePhoto.as_view(), name='unlike'),
-    path("", ViewPhotos.as_view(), name="view_photos"),
+    path('api/photo/<int:pk>/like/', like_api_view, name='like_api'),
+    path('api/photo/<int:pk>/unlike/', unlike_api_view, name='unlike_api'),
+    path("", feed_view, name="view_photos"),
     path("photos/my_photos/", MyPhotos.as_view(), name="my_photos"),
-    path("photo/<int:photo_id>/", OnePhoto.as_view(), name="one_photo"),
-] + static(MEDIA_URL, document_root=MEDIA_ROOT)
+    path("photos/hot/", HotPhotos.as_view(), name="hot_photos"),
+    path("photos/home/", HomeFeed.as_view(), name="home_feed"),
+    path("users/<int:pk>/follow/", FollowUser.as_view(), name="follow"),
+    path("users/<int:pk>/unfollow/", UnfollowUser.as_view(), name="unfollow"),
+    path("photos/export/", ExportPhotos.as_view(), name="export_photos"),
+    path("search/", SearchPhotos.as_view(), name="search"),
+    path("photo/<int:photo_id>/", one_photo_view, name="one_photo"),
+    path("photo/<int:photo_id>/comments/", PhotoComments.as_view(), name="photo_comments"),
+    path("photo/<int:photo_id>/similar/", SimilarPhotos.as_view(), name="similar_photos"),
+    path(f"{MEDIA_URL.lstrip('/')}<path:path>", MediaView.as_view(), name="media"),
+]